@@ -2,7 +2,9 @@ from flask import Flask, jsonify, request, g
 from flasgger import Swagger
 from flask_cors import CORS
 import mysql.connector
+import json
 import os
+from write_queue import WriteQueue
 
 app = Flask(__name__)
 CORS(app)
@@ -28,25 +30,146 @@ MYSQL_PASS = os.getenv("MYSQL_PASS", "")
 MYSQL_DB   = os.getenv("MYSQL_DB", "db_usuarios")
 MYSQL_PORT = int(os.getenv("MYSQL_PORT", "3306"))
 
+# --- Escrituras asíncronas (write-behind) ---
+ASYNC_WRITES = os.getenv("ASYNC_WRITES", "0") == "1"    # por defecto síncrono; ?async=1 lo activa por petición
+WRITE_QUEUE_PATH = os.getenv("WRITE_QUEUE_PATH", "write_queue.db")
+CHANGES_RETENTION_HOURS = float(os.getenv("CHANGES_RETENTION_HOURS", "24"))   # horas que se conserva el change-log
+
 # ---------- DB helpers ----------
+_changes_ready = False
+
+def connect():
+    global _changes_ready
+    db = mysql.connector.connect(
+        host=MYSQL_HOST,
+        user=MYSQL_USER,
+        password=MYSQL_PASS,
+        database=MYSQL_DB,
+        port=MYSQL_PORT
+    )
+    if not _changes_ready:
+        db.cursor().execute("""
+            CREATE TABLE IF NOT EXISTS changes (
+                seq BIGINT AUTO_INCREMENT PRIMARY KEY,
+                entity VARCHAR(20) NOT NULL,
+                entity_id INT NOT NULL,
+                op VARCHAR(10) NOT NULL,
+                data TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                INDEX (created_at)
+            )
+        """)
+        # jobs de la cola ya aplicados: hace idempotente la reentrega de un lote
+        db.cursor().execute("""
+            CREATE TABLE IF NOT EXISTS applied_jobs (
+                job_id CHAR(32) PRIMARY KEY,
+                result TEXT,
+                applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                INDEX (applied_at)
+            )
+        """)
+        _changes_ready = True
+    return db
+
 def get_db():
     db = getattr(g, '_database', None)
     if db is None:
-        db = g._database = mysql.connector.connect(
-            host=MYSQL_HOST,
-            user=MYSQL_USER,
-            password=MYSQL_PASS,
-            database=MYSQL_DB,
-            port=MYSQL_PORT
-        )
+        db = g._database = connect()
     return db
 
+def log_change(cur, entity, entity_id, op, data=None):
+    """Registra un cambio en el change-log (misma transacción que la escritura)"""
+    cur.execute("INSERT INTO changes (entity,entity_id,op,data) VALUES (%s,%s,%s,%s)",
+                (entity, entity_id, op, json.dumps(data) if data is not None else None))
+
 @app.teardown_appcontext
 def close_connection(exception):
     db = getattr(g, '_database', None)
     if db is not None:
         db.close()
 
+# ---------- Inserts (compartidos por la vía síncrona y la cola) ----------
+def insert_user(cur, data):
+    cur.execute("INSERT INTO users (name,email) VALUES (%s,%s)", (data['name'], data['email']))
+    user = {"id": cur.lastrowid, "name": data['name'], "email": data['email']}
+    log_change(cur, "user", user['id'], "create", user)
+    return user
+
+def insert_address(cur, data):
+    cur.execute("SELECT id FROM users WHERE id=%s", (data['user_id'],))
+    if not cur.fetchone():
+        raise LookupError("User not found")
+    cur.execute("INSERT INTO addresses (user_id,city,street) VALUES (%s,%s,%s)",
+                (data['user_id'], data.get('city'), data.get('street')))
+    address = {"id": cur.lastrowid, "user_id": data['user_id'], "city": data.get('city'), "street": data.get('street')}
+    log_change(cur, "address", address['id'], "create", address)
+    return address
+
+INSERTS = {"user": insert_user, "address": insert_address}
+DB_CONNECTION_ERRORS = (mysql.connector.OperationalError, mysql.connector.InterfaceError)
+
+def apply_jobs(jobs):
+    """Aplica un lote de la cola en una sola transacción; un savepoint por job aísla los fallos"""
+    db = connect()
+    try:
+        cur = db.cursor(buffered=True)
+        outcomes = []
+        for job in jobs:
+            # reentrega (worker muerto tras el commit o lote retomado por otro worker)
+            cur.execute("SELECT result FROM applied_jobs WHERE job_id=%s", (job['id'],))
+            row = cur.fetchone()
+            if row is not None:
+                outcomes.append((True, json.loads(row[0]) if row[0] else None))
+                continue
+            cur.execute("SAVEPOINT job")
+            try:
+                # se reserva el job id antes de escribir: si otro worker lo está aplicando, esto falla
+                cur.execute("INSERT INTO applied_jobs (job_id) VALUES (%s)", (job['id'],))
+            except mysql.connector.IntegrityError:
+                cur.execute("ROLLBACK TO SAVEPOINT job")
+                outcomes.append((None, None))
+                continue
+            try:
+                result = INSERTS[job['kind']](cur, job['payload'])
+                cur.execute("UPDATE applied_jobs SET result=%s WHERE job_id=%s",
+                            (json.dumps(result, default=str), job['id']))
+                outcomes.append((True, result))
+            except DB_CONNECTION_ERRORS:
+                raise    # conexión perdida: el lote entero vuelve a la cola
+            except Exception as e:
+                # cualquier otro error es de este job: falla solo él
+                cur.execute("ROLLBACK TO SAVEPOINT job")
+                outcomes.append((False, e))
+        db.commit()
+        return outcomes
+    finally:
+        db.close()
+
+def purge_old_rows(older_than):
+    """Limpieza periódica (housekeeping de la cola): jobs aplicados y change-log antiguo"""
+    db = connect()
+    try:
+        cur = db.cursor()
+        cur.execute("DELETE FROM applied_jobs WHERE applied_at < NOW() - INTERVAL %s SECOND", (int(older_than),))
+        cur.execute("DELETE FROM changes WHERE created_at < NOW() - INTERVAL %s SECOND",
+                    (int(CHANGES_RETENTION_HOURS * 3600),))
+        db.commit()
+    finally:
+        db.close()
+
+write_queue = WriteQueue(WRITE_QUEUE_PATH, apply_jobs, purge_old_rows, transient=DB_CONNECTION_ERRORS)
+
+def wants_async():
+    if request.args.get('async') is not None:
+        return request.args.get('async') in ('1', 'true')
+    return ASYNC_WRITES or 'respond-async' in request.headers.get('Prefer', '')
+
+def enqueue(kind, payload):
+    job_id = write_queue.enqueue(kind, payload)
+    resp = jsonify({"job_id": job_id, "status": "queued", "status_url": f"/jobs/{job_id}"})
+    resp.headers['Location'] = f"/jobs/{job_id}"
+    return resp, 202
+
 # ---------- USERS ----------
 @app.route('/users', methods=['GET'])
 def get_users():
@@ -135,20 +258,28 @@ def add_user():
           properties:
             name: {type: string}
             email: {type: string}
+      - name: async
+        in: query
+        type: integer
+        required: false
+        description: 1 = encolar y responder 202 con job_id (también con cabecera Prefer respond-async)
     responses:
       201:
         description: Usuario creado
+      202:
+        description: Alta encolada (consultar /jobs/{job_id})
       400:
         description: Datos inválidos
     """
     data = request.get_json() or {}
     if not data.get('name') or not data.get('email'):
         return jsonify({"error": "name and email required"}), 400
+    if wants_async():
+        return enqueue("user", {"name": data['name'], "email": data['email']})
     db = get_db()
-    cur = db.cursor()
-    cur.execute("INSERT INTO users (name,email) VALUES (%s,%s)", (data['name'], data['email']))
+    user = insert_user(db.cursor(), data)
     db.commit()
-    return jsonify({"id": cur.lastrowid, "name": data['name'], "email": data['email']}), 201
+    return jsonify(user), 201
 
 @app.route('/users/<int:user_id>', methods=['PUT'])
 def update_user(user_id):
@@ -179,9 +310,11 @@ def update_user(user_id):
     db = get_db()
     cur = db.cursor()
     cur.execute("UPDATE users SET name=%s, email=%s WHERE id=%s", (data.get('name'), data.get('email'), user_id))
-    db.commit()
     if cur.rowcount == 0:
+        db.commit()
         return jsonify({"error": "User not found"}), 404
+    log_change(cur, "user", user_id, "update", {"id": user_id, "name": data.get('name'), "email": data.get('email')})
+    db.commit()
     return jsonify({"status": "updated"})
 
 @app.route('/users/<int:user_id>', methods=['DELETE'])
@@ -204,9 +337,11 @@ def delete_user(user_id):
     cur = db.cursor()
     cur.execute("DELETE FROM addresses WHERE user_id=%s", (user_id,))
     cur.execute("DELETE FROM users WHERE id=%s", (user_id,))
-    db.commit()
     if cur.rowcount == 0:
+        db.commit()
         return jsonify({"error": "User not found"}), 404
+    log_change(cur, "user", user_id, "delete")
+    db.commit()
     return jsonify({"status": "deleted"})
 
 # --------------- ADDRESSES CRUD ---------------
@@ -282,25 +417,31 @@ def create_address():
             user_id: {type: integer}
             city: {type: string}
             street: {type: string}
+      - name: async
+        in: query
+        type: integer
+        required: false
+        description: 1 = encolar y responder 202 con job_id (también con cabecera Prefer respond-async)
     responses:
       201:
         description: Dirección creada
+      202:
+        description: Alta encolada (consultar /jobs/{job_id}; falla si el usuario no existe)
       400:
         description: Error en datos
     """
     data = request.get_json() or {}
     if not data.get('user_id'):
         return jsonify({"error": "user_id required"}), 400
+    if wants_async():
+        return enqueue("address", {"user_id": data['user_id'], "city": data.get('city'), "street": data.get('street')})
     db = get_db()
-    cur = db.cursor(dictionary=True)
-    cur.execute("SELECT id FROM users WHERE id=%s", (data['user_id'],))
-    if not cur.fetchone():
+    try:
+        address = insert_address(db.cursor(buffered=True), data)
+    except LookupError:
         return jsonify({"error": "User not found"}), 400
-    cur = db.cursor()
-    cur.execute("INSERT INTO addresses (user_id,city,street) VALUES (%s,%s,%s)",
-                (data['user_id'], data.get('city'), data.get('street')))
     db.commit()
-    return jsonify({"id": cur.lastrowid, "user_id": data['user_id'], "city": data.get('city'), "street": data.get('street')}), 201
+    return jsonify(address), 201
 
 @app.route('/addresses/<int:address_id>', methods=['PUT'])
 def update_address(address_id):
@@ -332,9 +473,11 @@ def update_address(address_id):
     cur = db.cursor()
     cur.execute("UPDATE addresses SET city=%s, street=%s WHERE id=%s",
                 (data.get('city'), data.get('street'), address_id))
-    db.commit()
     if cur.rowcount == 0:
+        db.commit()
         return jsonify({"error": "Address not found"}), 404
+    log_change(cur, "address", address_id, "update", {"id": address_id, "city": data.get('city'), "street": data.get('street')})
+    db.commit()
     return jsonify({"status": "updated"})
 
 @app.route('/addresses/<int:address_id>', methods=['DELETE'])
@@ -356,21 +499,174 @@ def delete_address(address_id):
     db = get_db()
     cur = db.cursor()
     cur.execute("DELETE FROM addresses WHERE id=%s", (address_id,))
-    db.commit()
     if cur.rowcount == 0:
+        db.commit()
         return jsonify({"error": "Address not found"}), 404
+    log_change(cur, "address", address_id, "delete")
+    db.commit()
     return jsonify({"status": "deleted"})
 
+# --------------- JOBS (escrituras asíncronas) ---------------
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """
+    Estado de una escritura asíncrona
+    ---
+    parameters:
+      - name: job_id
+        in: path
+        type: string
+        required: true
+    responses:
+      200:
+        description: "status: queued | processing | done (con result) | failed (con error)"
+      404:
+        description: Job no encontrado
+    """
+    job = write_queue.status(job_id)
+    if not job:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job)
+
+# --------------- CHECKSUM (reconciliación entre entornos) ---------------
+# Hash por fila = primeros 64 bits del MD5; el hash de un rango es el XOR de sus filas
+def _hash_field(col):
+    # <longitud>:<valor>, o \N si es NULL: ni un '|' dentro de un valor ni un NULL (que
+    # CONCAT_WS se saltaría) pueden hacer que dos filas distintas den el mismo texto
+    return rf"COALESCE(CONCAT(CHAR_LENGTH({col}),':',{col}),'\\N')"
+
+CHECKSUM_TABLES = {
+    "users": f"CONCAT_WS('|',id,{_hash_field('name')},{_hash_field('email')})",
+    "addresses": f"CONCAT_WS('|',id,{_hash_field('user_id')},{_hash_field('city')},{_hash_field('street')})",
+}
+ROW_HASH = "CAST(CONV(SUBSTRING(MD5({row}),1,16),16,10) AS UNSIGNED)"
+MAX_CHECKSUM_PARTS = 256
+MAX_CHECKSUM_ROWS = 5000
+
+@app.route('/checksum', methods=['GET'])
+def checksum():
+    """
+    Hash de los registros con id en [from, to), opcionalmente dividido en sub-rangos
+    ---
+    parameters:
+      - name: table
+        in: query
+        type: string
+        enum: [users, addresses]
+        default: users
+      - name: from
+        in: query
+        type: integer
+        required: false
+        description: Sin from/to se devuelven los límites (min id, max id + 1) y el hash de toda la tabla
+      - name: to
+        in: query
+        type: integer
+        required: false
+      - name: parts
+        in: query
+        type: integer
+        default: 1
+        description: Número de sub-rangos de igual tamaño (chunks)
+      - name: rows
+        in: query
+        type: integer
+        required: false
+        description: 1 = incluir id y hash de cada fila del rango (máx. 5000)
+    responses:
+      200:
+        description: from, to, count, hash y chunks [{from, to, count, hash}] (solo los no vacíos)
+      400:
+        description: Tabla desconocida
+    """
+    table = request.args.get('table', 'users')
+    row = CHECKSUM_TABLES.get(table)
+    if not row:
+        return jsonify({"error": "Unknown table"}), 400
+    row_hash = ROW_HASH.format(row=row)
+    lo = request.args.get('from', type=int)
+    hi = request.args.get('to', type=int)
+    db = get_db()
+    cur = db.cursor(dictionary=True)
+
+    if lo is None or hi is None:
+        cur.execute(f"SELECT MIN(id) AS lo, MAX(id) AS hi, COUNT(*) AS count, BIT_XOR({row_hash}) AS hash FROM {table}")
+        r = cur.fetchone()
+        return jsonify({
+            "table": table,
+            "from": r['lo'] if r['lo'] is not None else 0,
+            "to": r['hi'] + 1 if r['hi'] is not None else 0,
+            "count": r['count'],
+            "hash": format(int(r['hash']), 'x'),
+        })
+
+    parts = min(max(request.args.get('parts', default=1, type=int), 1), MAX_CHECKSUM_PARTS)
+    step = max(1, -(-(hi - lo) // parts))
+    cur.execute(f"""
+        SELECT FLOOR((id-%s)/%s) AS part, COUNT(*) AS count, BIT_XOR({row_hash}) AS hash
+        FROM {table} WHERE id>=%s AND id<%s GROUP BY part ORDER BY part
+    """, (lo, step, lo, hi))
+    chunks, count, total = [], 0, 0
+    for r in cur.fetchall():
+        start = lo + int(r['part']) * step
+        chunks.append({"from": start, "to": min(hi, start + step), "count": r['count'], "hash": format(int(r['hash']), 'x')})
+        count += r['count']
+        total ^= int(r['hash'])
+    body = {"table": table, "from": lo, "to": hi, "count": count, "hash": format(total, 'x'), "chunks": chunks}
+    if request.args.get('rows') == '1':
+        cur.execute(f"SELECT id, MD5({row}) AS hash FROM {table} WHERE id>=%s AND id<%s ORDER BY id LIMIT %s",
+                    (lo, hi, MAX_CHECKSUM_ROWS))
+        body['rows'] = cur.fetchall()
+    return jsonify(body)
+
+# --------------- CHANGE-LOG ---------------
+@app.route('/changes', methods=['GET'])
+def list_changes():
+    """
+    Cambios (altas/modificaciones/bajas) posteriores a una secuencia
+    ---
+    parameters:
+      - name: since
+        in: query
+        type: integer
+        required: false
+        description: Última secuencia conocida; sin este parámetro solo se devuelve last_seq
+      - name: limit
+        in: query
+        type: integer
+        default: 500
+    responses:
+      200:
+        description: last_seq, lista de cambios ordenada por seq y truncated (since anterior al change-log conservado)
+    """
+    since = request.args.get('since', type=int)
+    limit = request.args.get('limit', default=500, type=int)
+    db = get_db()
+    cur = db.cursor(dictionary=True)
+    cur.execute("SELECT COALESCE(MAX(seq),0) AS last_seq, MIN(seq) AS first_seq FROM changes")
+    row = cur.fetchone()
+    last_seq = row['last_seq']
+    changes = []
+    # cambios posteriores a `since` ya purgados: el cliente debe recargar su snapshot
+    truncated = since is not None and since < last_seq and (row['first_seq'] or 0) > since + 1
+    if since is not None:
+        cur.execute("SELECT seq,entity,entity_id,op,data FROM changes WHERE seq>%s ORDER BY seq LIMIT %s", (since, limit))
+        changes = cur.fetchall()
+        for c in changes:
+            c['data'] = json.loads(c['data']) if c['data'] else None
+    return jsonify({"last_seq": last_seq, "changes": changes, "truncated": truncated})
+
 # ------------ root/info --------------
 @app.route('/')
 def index():
     return jsonify({
         "status": "ok",
         "swagger_ui": "/apidocs",
-        "tables": ["users", "addresses"],
+        "tables": ["users", "addresses", "changes"],
         "relations": "1:N (user -> addresses)"
     })
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5001)
+    write_queue.start()    # con gunicorn lo arranca post_worker_init en cada worker
+    app.run(host='0.0.0.0', port=int(os.getenv('PORT', '5001')))
 
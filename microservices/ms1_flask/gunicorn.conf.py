@@ -0,0 +1,35 @@
+# gunicorn.conf.py - modo producción (reemplaza al servidor de desarrollo de Flask)
+# Uso: gunicorn -c gunicorn.conf.py app:app
+# Recarga sin cortar peticiones: kill -HUP <pid master>
+# Cada petición abre su propia conexión MySQL (get_db), así que preload es seguro.
+import multiprocessing
+import os
+import sys
+
+cores = multiprocessing.cpu_count()
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5001')}"
+worker_class = os.getenv("WORKER_CLASS", "gthread")                 # gthread | gevent | sync
+workers = int(os.getenv("WEB_CONCURRENCY", cores * 2 + 1))
+threads = int(os.getenv("THREADS", "4"))                            # solo aplica a gthread
+worker_connections = int(os.getenv("WORKER_CONNECTIONS", "1000"))   # solo aplica a gevent
+preload_app = os.getenv("PRELOAD", "1") == "1"
+timeout = int(os.getenv("TIMEOUT", "30"))
+graceful_timeout = int(os.getenv("GRACEFUL_TIMEOUT", "20"))
+keepalive = int(os.getenv("KEEPALIVE", "5"))
+max_requests = int(os.getenv("MAX_REQUESTS", "5000"))
+max_requests_jitter = int(os.getenv("MAX_REQUESTS_JITTER", "500"))
+accesslog = os.getenv("ACCESS_LOG", "-")
+loglevel = os.getenv("LOG_LEVEL", "info")
+
+
+def post_worker_init(worker):
+    # el consumidor de la cola arranca en cada worker (no en el master con preload), sin esperar a la primera petición
+    sys.modules["app"].write_queue.start()
+
+
+def worker_exit(server, worker):
+    # deja terminar el lote de la cola de escrituras antes de salir (reciclado por max_requests, HUP)
+    app = sys.modules.get("app")
+    if app is not None:
+        app.write_queue.stop(timeout=graceful_timeout)
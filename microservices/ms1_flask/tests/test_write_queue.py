@@ -0,0 +1,140 @@
+# Pruebas de WriteQueue (solo SQLite, con handlers simulados en lugar de MySQL)
+import os
+import sqlite3
+import sys
+import time
+
+import pytest
+
+HERE = os.path.dirname(__file__)
+sys.path.insert(0, os.path.join(HERE, ".."))
+import write_queue as wq  # noqa: E402
+
+
+class DbDown(Exception):
+    pass
+
+
+@pytest.fixture
+def make_queue(tmp_path):
+    def make(handler, consumer=False, **kwargs):
+        q = wq.WriteQueue(str(tmp_path / "queue.db"), handler, **kwargs)
+        if not consumer:
+            q.pid = os.getpid()    # sin hilo consumidor: la prueba llama a _claim/_process
+        return q
+    return make
+
+
+def ok_handler(jobs):
+    return [(True, {"echo": j["payload"]}) for j in jobs]
+
+
+def test_batches_are_claimed_in_order_and_finished(make_queue, monkeypatch):
+    monkeypatch.setattr(wq, "BATCH_SIZE", 2)
+    batches = []
+
+    def handler(jobs):
+        batches.append([j["payload"]["n"] for j in jobs])
+        return ok_handler(jobs)
+
+    q = make_queue(handler)
+    ids = [q.enqueue("x", {"n": n}) for n in range(5)]
+    for _ in range(3):
+        assert q._process(q._claim())
+    assert batches == [[0, 1], [2, 3], [4]]
+    assert [q.status(i)["status"] for i in ids] == ["done"] * 5
+    assert q.status(ids[4])["result"] == {"echo": {"n": 4}}
+
+
+def test_failed_job_does_not_affect_the_rest(make_queue):
+    q = make_queue(lambda jobs: [(False, LookupError("User not found")) if j["payload"]["bad"] else (True, 1)
+                                 for j in jobs])
+    good, bad = q.enqueue("x", {"bad": False}), q.enqueue("x", {"bad": True})
+    assert q._process(q._claim())
+    assert q.status(good)["status"] == "done"
+    assert (q.status(bad)["status"], q.status(bad)["error"]) == ("failed", "User not found")
+
+
+def test_transient_error_requeues_batch_without_spending_attempts(make_queue):
+    def down(jobs):
+        raise DbDown("connection refused")
+
+    q = make_queue(down, transient=(DbDown,))
+    job = q.enqueue("x", {})
+    for _ in range(wq.MAX_ATTEMPTS + 1):
+        assert not q._process(q._claim())
+    assert (q.status(job)["status"], q.status(job)["attempts"]) == ("queued", 0)
+
+
+def test_unexpected_error_isolates_poison_job_then_dead_letters_it(make_queue):
+    calls = []
+
+    def handler(jobs):
+        calls.append(len(jobs))
+        if any(j["payload"]["poison"] for j in jobs):
+            raise ValueError("A string literal cannot contain NUL (0x00) characters")
+        return ok_handler(jobs)
+
+    q = make_queue(handler, transient=(DbDown,))
+    first = q.enqueue("x", {"poison": False})
+    poison = q.enqueue("x", {"poison": True})
+    last = q.enqueue("x", {"poison": False})
+    q._process(q._claim())
+    assert calls == [3, 1, 1, 1]
+    assert q.status(first)["status"] == q.status(last)["status"] == "done"
+    assert (q.status(poison)["status"], q.status(poison)["attempts"]) == ("queued", 1)
+    for _ in range(wq.MAX_ATTEMPTS - 1):
+        q._process(q._claim())
+    assert q.status(poison)["status"] == "dead"
+    assert "NUL" in q.status(poison)["error"]
+    assert q._claim() == []
+
+
+def test_stale_processing_batch_is_replayed(make_queue, monkeypatch):
+    q = make_queue(ok_handler)
+    job = q.enqueue("x", {})
+    assert [j["id"] for j in q._claim()] == [job]    # el worker muere sin terminar el lote
+    assert q._claim() == []
+    q._housekeeping()
+    assert q._claim() == []                           # aún no es stale
+    monkeypatch.setattr(wq, "STALE_AFTER", 0)
+    time.sleep(0.01)
+    q._housekeeping()
+    assert [j["id"] for j in q._claim()] == [job]
+
+
+def test_job_applied_by_another_worker_is_left_alone(make_queue):
+    q = make_queue(lambda jobs: [(None, None) for _ in jobs])
+    job = q.enqueue("x", {})
+    q._process(q._claim())
+    assert q.status(job)["status"] == "processing"
+
+
+def test_empty_poll_does_not_take_the_write_lock(make_queue, tmp_path):
+    q = make_queue(ok_handler)
+    other = sqlite3.connect(str(tmp_path / "queue.db"), isolation_level=None)
+    other.execute("BEGIN IMMEDIATE")
+    try:
+        t0 = time.monotonic()
+        assert q._claim() == []
+        assert time.monotonic() - t0 < 1
+    finally:
+        other.execute("ROLLBACK")
+
+
+def test_stop_lets_the_consumer_exit(make_queue):
+    q = make_queue(ok_handler, consumer=True)
+    job = q.enqueue("x", {})
+    deadline = time.monotonic() + 2
+    while q.status(job)["status"] != "done" and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert q.status(job)["status"] == "done"
+    q.stop(timeout=2)
+    assert not q.thread.is_alive()
+
+
+def test_ms2_copy_is_identical():
+    # cada servicio se construye con su propio contexto de Docker, así que el módulo está duplicado
+    with open(os.path.join(HERE, "..", "write_queue.py"), "rb") as a, \
+            open(os.path.join(HERE, "..", "..", "ms2_fastapi", "write_queue.py"), "rb") as b:
+        assert a.read() == b.read()
@@ -1,9 +1,13 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Header, Query
+from fastapi.responses import JSONResponse
 from pydantic import BaseModel
+from typing import Optional
 import psycopg2
-from psycopg2.extras import RealDictCursor
+from psycopg2.extras import RealDictCursor, Json
+import json
 import os
 from fastapi.middleware.cors import CORSMiddleware
+from write_queue import WriteQueue
 app = FastAPI(title="Pacientes API", description="Microservicio de gestión de pacientes y citas médicas", version="1.0")
 app.add_middleware(
     CORSMiddleware,
@@ -22,9 +26,138 @@ DB_CONFIG = {
     "port": os.getenv("PG_PORT", 5432),
 }
 
+# ---------- Escrituras asíncronas (write-behind) ----------
+ASYNC_WRITES = os.getenv("ASYNC_WRITES", "0") == "1"    # por defecto síncrono; ?async=1 lo activa por petición
+WRITE_QUEUE_PATH = os.getenv("WRITE_QUEUE_PATH", "write_queue.db")
+CHANGES_RETENTION_HOURS = float(os.getenv("CHANGES_RETENTION_HOURS", "24"))   # horas que se conserva el change-log
+
+
+_changes_ready = False
+
 
 def get_conn():
-    return psycopg2.connect(**DB_CONFIG, cursor_factory=RealDictCursor)
+    global _changes_ready
+    conn = psycopg2.connect(**DB_CONFIG, cursor_factory=RealDictCursor)
+    if not _changes_ready:
+        # el change-log se crea en la primera conexión: también en BDs ya inicializadas con /init
+        cur = conn.cursor()
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS changes (
+                seq BIGSERIAL PRIMARY KEY,
+                entity VARCHAR(20) NOT NULL,
+                entity_id INT NOT NULL,
+                op VARCHAR(10) NOT NULL,
+                data JSONB,
+                created_at TIMESTAMP DEFAULT now()
+            )
+        """)
+        # jobs de la cola ya aplicados: hace idempotente la reentrega de un lote
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS applied_jobs (
+                job_id CHAR(32) PRIMARY KEY,
+                result JSONB,
+                applied_at TIMESTAMP DEFAULT now()
+            )
+        """)
+        cur.execute("CREATE INDEX IF NOT EXISTS applied_jobs_applied_at ON applied_jobs (applied_at)")
+        cur.execute("CREATE INDEX IF NOT EXISTS changes_created_at ON changes (created_at)")
+        conn.commit()
+        _changes_ready = True
+    return conn
+
+
+def log_change(cur, entity, entity_id, op, data=None):
+    """Registra un cambio en el change-log (misma transacción que la escritura)"""
+    cur.execute("INSERT INTO changes (entity, entity_id, op, data) VALUES (%s,%s,%s,%s)",
+                (entity, entity_id, op, Json(data) if data is not None else None))
+
+
+def insert_appointment(cur, ap):
+    """Inserta una cita (compartido por la vía síncrona y la cola)"""
+    cur.execute("SELECT id FROM patients WHERE id=%s", (ap["patient_id"],))
+    if not cur.fetchone():
+        raise LookupError("Paciente no existe")
+    cur.execute("INSERT INTO appointments (patient_id,date,reason) VALUES (%s,%s,%s) RETURNING *",
+                (ap["patient_id"], ap["date"], ap["reason"]))
+    new_ap = cur.fetchone()
+    log_change(cur, "appointment", new_ap["id"], "create", new_ap)
+    return new_ap
+
+
+INSERTS = {"appointment": insert_appointment}
+DB_CONNECTION_ERRORS = (psycopg2.OperationalError, psycopg2.InterfaceError)
+
+
+def apply_jobs(jobs):
+    """Aplica un lote de la cola en una sola transacción; un savepoint por job aísla los fallos"""
+    conn = get_conn()
+    try:
+        cur = conn.cursor()
+        outcomes = []
+        for job in jobs:
+            # reentrega (worker muerto tras el commit o lote retomado por otro worker)
+            cur.execute("SELECT result FROM applied_jobs WHERE job_id=%s", (job["id"],))
+            row = cur.fetchone()
+            if row is not None:
+                outcomes.append((True, row["result"]))
+                continue
+            cur.execute("SAVEPOINT job")
+            try:
+                # se reserva el job id antes de escribir: si otro worker lo está aplicando, esto falla
+                cur.execute("INSERT INTO applied_jobs (job_id) VALUES (%s)", (job["id"],))
+            except psycopg2.IntegrityError:
+                cur.execute("ROLLBACK TO SAVEPOINT job")
+                outcomes.append((None, None))
+                continue
+            try:
+                result = INSERTS[job["kind"]](cur, job["payload"])
+                cur.execute("UPDATE applied_jobs SET result=%s WHERE job_id=%s",
+                            (Json(result, dumps=lambda o: json.dumps(o, default=str)), job["id"]))
+                outcomes.append((True, result))
+            except DB_CONNECTION_ERRORS:
+                raise    # conexión perdida: el lote entero vuelve a la cola
+            except Exception as e:
+                # cualquier otro error es de este job (p.ej. UndefinedTable, o ValueError por un \x00): falla solo él
+                cur.execute("ROLLBACK TO SAVEPOINT job")
+                outcomes.append((False, e))
+        conn.commit()
+        return outcomes
+    finally:
+        conn.close()
+
+
+def purge_old_rows(older_than):
+    """Limpieza periódica (housekeeping de la cola): jobs aplicados y change-log antiguo"""
+    conn = get_conn()
+    try:
+        cur = conn.cursor()
+        cur.execute("DELETE FROM applied_jobs WHERE applied_at < now() - make_interval(secs => %s)", (older_than,))
+        cur.execute("DELETE FROM changes WHERE created_at < now() - make_interval(secs => %s)",
+                    (CHANGES_RETENTION_HOURS * 3600,))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+write_queue = WriteQueue(WRITE_QUEUE_PATH, apply_jobs, purge_old_rows, transient=DB_CONNECTION_ERRORS)
+
+
+@app.on_event("startup")
+def start_write_queue():
+    # se ejecuta en cada worker (después del fork si hay preload)
+    write_queue.start()
+
+
+@app.on_event("shutdown")
+def stop_write_queue():
+    # deja terminar el lote en curso al reciclar el worker (max_requests, HUP)
+    write_queue.stop()
+
+
+def wants_async(async_: Optional[bool], prefer: Optional[str]):
+    if async_ is not None:
+        return async_
+    return ASYNC_WRITES or "respond-async" in (prefer or "")
 
 
 # ---------- Modelos Pydantic ----------
@@ -67,6 +200,8 @@ def init_db():
             cur.execute("INSERT INTO patients (name, age) VALUES (%s,%s)", (f"Patient{i}", 20 + (i % 60)))
             cur.execute("INSERT INTO appointments (patient_id, date, reason) VALUES (%s,%s,%s)",
                         (i, f"2025-10-{(i%28)+1:02d}", f"Consulta general {i}"))
+        # carga masiva: los clientes del feed recargan el listado completo
+        log_change(cur, "patient", 0, "reset")
     conn.commit()
     conn.close()
     return {"status": "initialized"}
@@ -109,6 +244,7 @@ def create_patient(patient: Patient):
     cur = conn.cursor()
     cur.execute("INSERT INTO patients (name, age) VALUES (%s,%s) RETURNING *", (patient.name, patient.age))
     new_patient = cur.fetchone()
+    log_change(cur, "patient", new_patient["id"], "create", new_patient)
     conn.commit()
     conn.close()
     return new_patient
@@ -122,6 +258,8 @@ def update_patient(patient_id: int, patient: Patient):
     cur.execute("UPDATE patients SET name=%s, age=%s WHERE id=%s RETURNING *",
                 (patient.name, patient.age, patient_id))
     updated = cur.fetchone()
+    if updated:
+        log_change(cur, "patient", patient_id, "update", updated)
     conn.commit()
     conn.close()
     if not updated:
@@ -136,6 +274,8 @@ def delete_patient(patient_id: int):
     cur = conn.cursor()
     cur.execute("DELETE FROM patients WHERE id=%s RETURNING id", (patient_id,))
     deleted = cur.fetchone()
+    if deleted:
+        log_change(cur, "patient", patient_id, "delete")
     conn.commit()
     conn.close()
     if not deleted:
@@ -178,19 +318,22 @@ def get_appointment(appointment_id: int):
     return row
 
 
-@app.post("/appointments", status_code=201)
-def create_appointment(ap: Appointment):
-    """Crea una nueva cita médica"""
+@app.post("/appointments", status_code=201, responses={202: {"description": "Cita encolada (consultar /jobs/{job_id})"}})
+def create_appointment(ap: Appointment,
+                       async_: Optional[bool] = Query(None, alias="async"),
+                       prefer: Optional[str] = Header(None)):
+    """Crea una nueva cita médica (con ?async=1 o `Prefer: respond-async` se encola y responde 202)"""
+    if wants_async(async_, prefer):
+        job_id = write_queue.enqueue("appointment", ap.dict())
+        return JSONResponse({"job_id": job_id, "status": "queued", "status_url": f"/jobs/{job_id}"},
+                            status_code=202, headers={"Location": f"/jobs/{job_id}"})
     conn = get_conn()
     cur = conn.cursor()
-    # verificar que el paciente exista
-    cur.execute("SELECT id FROM patients WHERE id=%s", (ap.patient_id,))
-    if not cur.fetchone():
+    try:
+        new_ap = insert_appointment(cur, ap.dict())
+    except LookupError as e:
         conn.close()
-        raise HTTPException(400, "Paciente no existe")
-    cur.execute("INSERT INTO appointments (patient_id,date,reason) VALUES (%s,%s,%s) RETURNING *",
-                (ap.patient_id, ap.date, ap.reason))
-    new_ap = cur.fetchone()
+        raise HTTPException(400, str(e))
     conn.commit()
     conn.close()
     return new_ap
@@ -204,6 +347,8 @@ def update_appointment(appointment_id: int, ap: Appointment):
     cur.execute("UPDATE appointments SET date=%s, reason=%s WHERE id=%s RETURNING *",
                 (ap.date, ap.reason, appointment_id))
     updated = cur.fetchone()
+    if updated:
+        log_change(cur, "appointment", appointment_id, "update", updated)
     conn.commit()
     conn.close()
     if not updated:
@@ -218,6 +363,8 @@ def delete_appointment(appointment_id: int):
     cur = conn.cursor()
     cur.execute("DELETE FROM appointments WHERE id=%s RETURNING id", (appointment_id,))
     deleted = cur.fetchone()
+    if deleted:
+        log_change(cur, "appointment", appointment_id, "delete")
     conn.commit()
     conn.close()
     if not deleted:
@@ -225,12 +372,113 @@ def delete_appointment(appointment_id: int):
     return {"status": "deleted", "id": deleted["id"]}
 
 
+# ---------- Checksum (reconciliación entre entornos) ----------
+# Hash por fila = primeros 60 bits del MD5; el hash de un rango es la suma de sus filas
+# (bit_xor solo existe desde Postgres 14)
+def _hash_field(col):
+    # <longitud>:<valor>, o \N si es NULL: ni un '|' dentro de un valor ni un NULL (que
+    # concat_ws se saltaría) pueden hacer que dos filas distintas den el mismo texto
+    return rf"coalesce(length({col}::text) || ':' || {col}::text, '\N')"
+
+
+CHECKSUM_TABLES = {
+    "patients": f"concat_ws('|', id, {_hash_field('name')}, {_hash_field('age')})",
+    "appointments": f"concat_ws('|', id, {_hash_field('patient_id')}, {_hash_field('date')}, {_hash_field('reason')})",
+}
+ROW_HASH = "('x' || substr(md5({row}), 1, 15))::bit(60)::bigint"
+MAX_CHECKSUM_PARTS = 256
+MAX_CHECKSUM_ROWS = 5000
+
+
+@app.get("/checksum")
+def checksum(table: str = "patients",
+             from_: Optional[int] = Query(None, alias="from"),
+             to: Optional[int] = None,
+             parts: int = 1,
+             rows: int = 0):
+    """
+    Hash de los registros con id en [from, to) y de `parts` sub-rangos de igual tamaño.
+    Sin from/to devuelve los límites (min id, max id + 1) y el hash de toda la tabla.
+    Con rows=1 incluye id y hash de cada fila (máx. 5000).
+    """
+    row = CHECKSUM_TABLES.get(table)
+    if not row:
+        raise HTTPException(400, "Tabla desconocida")
+    row_hash = ROW_HASH.format(row=row)
+    conn = get_conn()
+    cur = conn.cursor()
+
+    if from_ is None or to is None:
+        cur.execute(f"SELECT MIN(id) AS lo, MAX(id) AS hi, COUNT(*) AS count, COALESCE(SUM({row_hash}), 0) AS hash FROM {table}")
+        r = cur.fetchone()
+        conn.close()
+        return {
+            "table": table,
+            "from": r["lo"] if r["lo"] is not None else 0,
+            "to": r["hi"] + 1 if r["hi"] is not None else 0,
+            "count": r["count"],
+            "hash": format(int(r["hash"]), "x"),
+        }
+
+    parts = min(max(parts, 1), MAX_CHECKSUM_PARTS)
+    step = max(1, -(-(to - from_) // parts))
+    cur.execute(f"""
+        SELECT (id - %s) / %s AS part, COUNT(*) AS count, SUM({row_hash}) AS hash
+        FROM {table} WHERE id >= %s AND id < %s GROUP BY part ORDER BY part
+    """, (from_, step, from_, to))
+    chunks, count, total = [], 0, 0
+    for r in cur.fetchall():
+        start = from_ + r["part"] * step
+        chunks.append({"from": start, "to": min(to, start + step), "count": r["count"], "hash": format(int(r["hash"]), "x")})
+        count += r["count"]
+        total += int(r["hash"])
+    body = {"table": table, "from": from_, "to": to, "count": count, "hash": format(total, "x"), "chunks": chunks}
+    if rows == 1:
+        cur.execute(f"SELECT id, md5({row}) AS hash FROM {table} WHERE id >= %s AND id < %s ORDER BY id LIMIT %s",
+                    (from_, to, MAX_CHECKSUM_ROWS))
+        body["rows"] = cur.fetchall()
+    conn.close()
+    return body
+
+
+# ---------- Jobs (escrituras asíncronas) ----------
+@app.get("/jobs/{job_id}")
+def get_job(job_id: str):
+    """Estado de una escritura asíncrona: queued | processing | done (con result) | failed (con error)"""
+    job = write_queue.status(job_id)
+    if not job:
+        raise HTTPException(404, "Job no encontrado")
+    return job
+
+
+# ---------- Change-log ----------
+@app.get("/changes")
+def list_changes(since: Optional[int] = None, limit: int = 500):
+    """
+    Cambios posteriores a `since` (sin `since` solo devuelve last_seq).
+    `truncated` indica que parte de esos cambios ya se purgó y hay que recargar el snapshot.
+    """
+    conn = get_conn()
+    cur = conn.cursor()
+    cur.execute("SELECT COALESCE(MAX(seq), 0) AS last_seq, MIN(seq) AS first_seq FROM changes")
+    row = cur.fetchone()
+    last_seq = row["last_seq"]
+    changes = []
+    truncated = since is not None and since < last_seq and (row["first_seq"] or 0) > since + 1
+    if since is not None:
+        cur.execute("SELECT seq,entity,entity_id,op,data FROM changes WHERE seq>%s ORDER BY seq LIMIT %s",
+                    (since, limit))
+        changes = cur.fetchall()
+    conn.close()
+    return {"last_seq": last_seq, "changes": changes, "truncated": truncated}
+
+
 @app.get("/")
 def index():
     return {
         "status": "ok",
         "swagger_ui": "/docs",
         "redoc": "/redoc",
-        "tables": ["patients", "appointments"],
+        "tables": ["patients", "appointments", "changes"],
         "relation": "1:N (patient -> appointments)"
     }
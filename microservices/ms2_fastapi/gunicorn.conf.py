@@ -0,0 +1,22 @@
+# gunicorn.conf.py - modo producción: gunicorn como gestor de procesos + workers uvicorn
+# Uso: gunicorn -c gunicorn.conf.py app:app
+# Recarga sin cortar peticiones: kill -HUP <pid master>
+# Los endpoints son `def` síncronos (psycopg2): FastAPI los ejecuta en su threadpool,
+# así que la concurrencia real sale de varios procesos worker.
+import multiprocessing
+import os
+
+cores = multiprocessing.cpu_count()
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5002')}"
+worker_class = "uvicorn_worker.UvicornWorker"     # paquete uvicorn-worker (uvicorn.workers está obsoleto)
+workers = int(os.getenv("WEB_CONCURRENCY", cores * 2 + 1))
+preload_app = os.getenv("PRELOAD", "1") == "1"
+timeout = int(os.getenv("TIMEOUT", "30"))
+graceful_timeout = int(os.getenv("GRACEFUL_TIMEOUT", "20"))
+keepalive = int(os.getenv("KEEPALIVE", "5"))
+max_requests = int(os.getenv("MAX_REQUESTS", "5000"))
+max_requests_jitter = int(os.getenv("MAX_REQUESTS_JITTER", "500"))
+accesslog = os.getenv("ACCESS_LOG", "-")
+loglevel = os.getenv("LOG_LEVEL", "info")
+
@@ -0,0 +1,224 @@
+# write_queue.py - cola local durable (SQLite en modo WAL) para escrituras asíncronas
+#
+# enqueue() guarda el trabajo y devuelve un job id en cuanto está en disco.
+# Un hilo por proceso reclama lotes de trabajos y se los pasa a `handler(jobs)`,
+# que debe aplicarlos en UNA transacción de la BD principal (group commit) y
+# devolver una lista [(ok, resultado_o_error), ...] en el mismo orden; ok=None
+# indica que otro worker está aplicando ese job y no se toca su estado.
+# Si el proceso muere entre el commit en la BD y marcar el lote como hecho, el
+# lote se vuelve a entregar tras STALE_AFTER segundos: el handler debe ser
+# idempotente (registrar el job id en la misma transacción y saltarse los ya aplicados).
+#
+# Si el handler lanza una excepción de `transient` (BD caída) el lote vuelve a la
+# cola sin gastar intentos. Cualquier otra excepción se aísla reintentando los jobs
+# de uno en uno; un job que falla solo MAX_ATTEMPTS veces pasa a `dead` (se conserva
+# para inspección) para no bloquear la cabeza de la cola.
+#
+# ms1_flask/write_queue.py y ms2_fastapi/write_queue.py son copias idénticas (cada
+# servicio se construye con su propio contexto de Docker); ms1_flask/tests lo comprueba.
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+BATCH_SIZE = int(os.getenv("WRITE_QUEUE_BATCH", "200"))
+LINGER = float(os.getenv("WRITE_QUEUE_LINGER", "0.02"))        # seg. para juntar más trabajos en un lote
+POLL = float(os.getenv("WRITE_QUEUE_POLL", "0.2"))             # seg. entre lecturas si no hay avisos
+RETENTION = float(os.getenv("WRITE_QUEUE_RETENTION", "3600"))  # seg. que se conservan jobs terminados
+MAX_ATTEMPTS = int(os.getenv("WRITE_QUEUE_MAX_ATTEMPTS", "5"))  # fallos de un job aislado antes de `dead`
+STALE_AFTER = 60.0
+RETRY_BACKOFF = 1.0
+
+
+class WriteQueue:
+    def __init__(self, path, handler, purge=None, transient=()):
+        self.path = path
+        self.handler = handler
+        self.purge = purge          # purge(segundos): limpieza opcional en la BD principal
+        self.transient = transient  # excepciones del handler que reintentan el lote sin gastar intentos
+        self.wakeup = threading.Event()
+        self.stopping = threading.Event()
+        self.thread = None
+        self.local = threading.local()
+        self.pid = None
+        self.lock = threading.Lock()
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                id TEXT UNIQUE NOT NULL,
+                kind TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                result TEXT,
+                error TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, seq)")
+        if "attempts" not in [c["name"] for c in conn.execute("PRAGMA table_info(jobs)")]:
+            conn.execute("ALTER TABLE jobs ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0")
+
+    def _conn(self):
+        # conexión por hilo (y por proceso: no se reutiliza tras un fork)
+        conn = getattr(self.local, "conn", None)
+        if conn is None or self.local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA synchronous=FULL")    # el ack implica que el job ya está en disco
+            conn.row_factory = sqlite3.Row
+            self.local.conn, self.local.pid = conn, os.getpid()
+        return conn
+
+    def start(self):
+        """Arranca el hilo consumidor de este proceso (idempotente, seguro tras fork)"""
+        with self.lock:
+            if self.pid == os.getpid():
+                return
+            self.pid = os.getpid()
+            self.stopping.clear()
+            self.thread = threading.Thread(target=self._run, daemon=True)
+            self.thread.start()
+
+    def stop(self, timeout=10):
+        """Deja terminar el lote en curso y para el consumidor (al salir el worker)"""
+        with self.lock:
+            thread = self.thread if self.pid == os.getpid() else None
+        if thread is None:
+            return
+        self.stopping.set()
+        self.wakeup.set()
+        thread.join(timeout)
+
+    def enqueue(self, kind, payload):
+        self.start()
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        self._conn().execute(
+            "INSERT INTO jobs (id, kind, payload, status, created_at, updated_at) VALUES (?,?,?,'queued',?,?)",
+            (job_id, kind, json.dumps(payload), now, now))
+        self.wakeup.set()
+        return job_id
+
+    def status(self, job_id):
+        row = self._conn().execute(
+            "SELECT id, kind, status, attempts, result, error, created_at, updated_at FROM jobs WHERE id=?",
+            (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+    # ---------- consumidor ----------
+    def _claim(self):
+        conn = self._conn()
+        # lectura sin bloqueo (WAL): el lock de escritura solo se pide si hay trabajo
+        if conn.execute("SELECT 1 FROM jobs WHERE status='queued' LIMIT 1").fetchone() is None:
+            return []
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows = conn.execute(
+                "SELECT seq, id, kind, payload FROM jobs WHERE status='queued' ORDER BY seq LIMIT ?",
+                (BATCH_SIZE,)).fetchall()
+            if rows:
+                conn.execute(
+                    f"UPDATE jobs SET status='processing', updated_at=? WHERE seq IN ({','.join('?' * len(rows))})",
+                    (time.time(), *[r["seq"] for r in rows]))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return [{"seq": r["seq"], "id": r["id"], "kind": r["kind"], "payload": json.loads(r["payload"])} for r in rows]
+
+    def _finish(self, jobs, outcomes):
+        now = time.time()
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        for job, (ok, value) in zip(jobs, outcomes):
+            if ok is None:
+                continue    # lo está aplicando otro worker, que lo marcará
+            if ok:
+                conn.execute("UPDATE jobs SET status='done', result=?, updated_at=? WHERE seq=?",
+                             (json.dumps(value, default=str), now, job["seq"]))
+            else:
+                conn.execute("UPDATE jobs SET status='failed', error=?, updated_at=? WHERE seq=?",
+                             (str(value), now, job["seq"]))
+        conn.execute("COMMIT")
+
+    def _requeue(self, jobs):
+        seqs = [j["seq"] for j in jobs]
+        self._conn().execute(
+            f"UPDATE jobs SET status='queued', updated_at=? WHERE seq IN ({','.join('?' * len(seqs))})",
+            (time.time(), *seqs))
+
+    def _failed_attempt(self, job, error):
+        """Fallo inesperado de un job aislado: vuelve a la cola o pasa a `dead` tras MAX_ATTEMPTS"""
+        self._conn().execute(
+            "UPDATE jobs SET attempts=attempts+1, error=?, updated_at=?, "
+            "status=CASE WHEN attempts+1>=? THEN 'dead' ELSE 'queued' END WHERE seq=?",
+            (str(error), time.time(), MAX_ATTEMPTS, job["seq"]))
+
+    def _process(self, jobs):
+        """Aplica un lote; devuelve False si hay que esperar RETRY_BACKOFF antes del siguiente"""
+        try:
+            outcomes = self.handler(jobs)
+        except self.transient as e:
+            # BD principal caída: los trabajos vuelven a la cola
+            print("write_queue: batch failed, requeueing:", e, flush=True)
+            self._requeue(jobs)
+            return False
+        except Exception as e:
+            if len(jobs) == 1:
+                print("write_queue: job failed:", jobs[0]["id"], e, flush=True)
+                self._failed_attempt(jobs[0], e)
+                return False
+            # error inesperado: se reintenta job a job para aislar al culpable
+            for i, job in enumerate(jobs):
+                try:
+                    outcomes = self.handler([job])
+                except self.transient as e:
+                    print("write_queue: batch failed, requeueing:", e, flush=True)
+                    self._requeue(jobs[i:])
+                    return False
+                except Exception as e:
+                    print("write_queue: job failed:", job["id"], e, flush=True)
+                    self._failed_attempt(job, e)
+                    continue
+                self._finish([job], outcomes)
+            return False
+        self._finish(jobs, outcomes)
+        return True
+
+    def _housekeeping(self):
+        now = time.time()
+        conn = self._conn()
+        conn.execute("UPDATE jobs SET status='queued', updated_at=? WHERE status='processing' AND updated_at<?",
+                     (now, now - STALE_AFTER))
+        conn.execute("DELETE FROM jobs WHERE status IN ('done','failed') AND updated_at<?", (now - RETENTION,))
+        if self.purge:
+            self.purge(RETENTION)
+
+    def _run(self):
+        last_housekeeping = 0.0
+        while not self.stopping.is_set():
+            try:
+                if time.time() - last_housekeeping > STALE_AFTER:
+                    last_housekeeping = time.time()
+                    self._housekeeping()
+                jobs = self._claim()
+                if not jobs:
+                    self.wakeup.wait(POLL)
+                    if self.wakeup.is_set() and not self.stopping.is_set():
+                        self.wakeup.clear()
+                        time.sleep(LINGER)
+                    continue
+                if not self._process(jobs):
+                    self.stopping.wait(RETRY_BACKOFF)
+            except Exception as e:
+                print("write_queue: error:", e, flush=True)
+                self.stopping.wait(RETRY_BACKOFF)
@@ -1,4 +1,5 @@
 const express = require("express");
+const crypto = require("crypto");
 const cors = require('cors');
 const { MongoClient, ObjectId } = require("mongodb");
 const swaggerUi = require("swagger-ui-express");
@@ -10,6 +11,7 @@ app.use(express.json());
 const PORT = 5003;
 const MONGO = process.env.MONGO_URI || "mongodb://172.31.22.15:27017"; // IP privada MV-BD
 const DBNAME = "clinicdb";
+const CHANGES_RETENTION_HOURS = parseFloat(process.env.CHANGES_RETENTION_HOURS || "24"); // horas que se conserva el change-log
 
 let db;
 
@@ -17,10 +19,35 @@ let db;
 MongoClient.connect(MONGO, { useUnifiedTopology: true })
   .then((client) => {
     db = client.db(DBNAME);
+    db.collection("changes").createIndex({ seq: 1 }, { unique: true });
+    // índice TTL: Mongo borra solo los cambios más antiguos que la retención
+    db.collection("changes")
+      .createIndex({ created_at: 1 }, { expireAfterSeconds: Math.round(CHANGES_RETENTION_HOURS * 3600) })
+      .catch((err) => console.error("❌ Índice TTL de changes:", err.message));
     console.log("✅ Conectado a MongoDB");
   })
   .catch((err) => console.error("❌ Error Mongo:", err));
 
+// ---------- Change-log ----------
+// Cada escritura deja un registro con una secuencia creciente (contador en "counters")
+async function logChange(entity, entityId, op, data = null) {
+  const counter = await db
+    .collection("counters")
+    .findOneAndUpdate(
+      { _id: "changes" },
+      { $inc: { seq: 1 } },
+      { upsert: true, returnDocument: "after" }
+    );
+  await db.collection("changes").insertOne({
+    seq: counter.seq,
+    entity,
+    entity_id: String(entityId),
+    op,
+    data,
+    created_at: new Date(),
+  });
+}
+
 // ---------- Swagger Config ----------
 const options = {
   definition: {
@@ -75,6 +102,9 @@ app.get("/init", async (req, res) => {
       });
     }
     await studentsCol.insertMany(students);
+    // carga masiva: los clientes del feed recargan el listado completo
+    await logChange("exam", 0, "reset");
+    await logChange("student", 0, "reset");
 
     res.json({ status: "ok", exams: 50, students: 50 });
   } catch (e) {
@@ -131,6 +161,12 @@ app.post("/exams", async (req, res) => {
     const result = await db
       .collection("exams")
       .insertOne({ type, specialty, date });
+    await logChange("exam", result.insertedId, "create", {
+      _id: result.insertedId,
+      type,
+      specialty,
+      date,
+    });
     res.status(201).json({ id: result.insertedId, type, specialty, date });
   } catch (e) {
     res.status(400).json({ error: e.toString() });
@@ -154,6 +190,12 @@ app.put("/exams/:id", async (req, res) => {
       );
     if (result.matchedCount === 0)
       return res.status(404).json({ error: "Exam not found" });
+    await logChange("exam", req.params.id, "update", {
+      _id: req.params.id,
+      type,
+      specialty,
+      date,
+    });
     res.json({ status: "updated" });
   } catch (e) {
     res.status(400).json({ error: e.toString() });
@@ -173,6 +215,7 @@ app.delete("/exams/:id", async (req, res) => {
       .deleteOne({ _id: new ObjectId(req.params.id) });
     if (result.deletedCount === 0)
       return res.status(404).json({ error: "Exam not found" });
+    await logChange("exam", req.params.id, "delete");
     res.json({ status: "deleted" });
   } catch (e) {
     res.status(400).json({ error: e.toString() });
@@ -225,6 +268,12 @@ app.post("/students", async (req, res) => {
     const result = await db
       .collection("students")
       .insertOne({ name, age, exam_id });
+    await logChange("student", result.insertedId, "create", {
+      _id: result.insertedId,
+      name,
+      age,
+      exam_id,
+    });
     res.status(201).json({ id: result.insertedId, name, age, exam_id });
   } catch (e) {
     res.status(400).json({ error: e.toString() });
@@ -248,6 +297,12 @@ app.put("/students/:id", async (req, res) => {
       );
     if (result.matchedCount === 0)
       return res.status(404).json({ error: "Student not found" });
+    await logChange("student", req.params.id, "update", {
+      _id: req.params.id,
+      name,
+      age,
+      exam_id,
+    });
     res.json({ status: "updated" });
   } catch (e) {
     res.status(400).json({ error: e.toString() });
@@ -267,18 +322,180 @@ app.delete("/students/:id", async (req, res) => {
       .deleteOne({ _id: new ObjectId(req.params.id) });
     if (result.deletedCount === 0)
       return res.status(404).json({ error: "Student not found" });
+    await logChange("student", req.params.id, "delete");
     res.json({ status: "deleted" });
   } catch (e) {
     res.status(400).json({ error: e.toString() });
   }
 });
 
+// =================== CHANGE-LOG ===================
+/**
+ * @swagger
+ * /changes:
+ *   get:
+ *     summary: Cambios posteriores a una secuencia (sin "since" solo devuelve last_seq)
+ *     parameters:
+ *       - in: query
+ *         name: since
+ *         schema: { type: integer }
+ *       - in: query
+ *         name: limit
+ *         schema: { type: integer, default: 500 }
+ */
+app.get("/changes", async (req, res) => {
+  try {
+    const counter = await db.collection("counters").findOne({ _id: "changes" });
+    const lastSeq = counter ? counter.seq : 0;
+    let changes = [];
+    let truncated = false;
+    if (req.query.since !== undefined) {
+      const since = parseInt(req.query.since, 10) || 0;
+      const limit = parseInt(req.query.limit, 10) || 500;
+      changes = await db
+        .collection("changes")
+        .find({ seq: { $gt: since } }, { projection: { _id: 0, created_at: 0 } })
+        .sort({ seq: 1 })
+        .limit(limit)
+        .toArray();
+      // cambios posteriores a `since` ya purgados por el TTL: el cliente debe recargar su snapshot
+      const first = await db.collection("changes").find({}, { projection: { seq: 1 } }).sort({ seq: 1 }).limit(1).next();
+      truncated = since < lastSeq && (!first || first.seq > since + 1);
+    }
+    res.json({ last_seq: lastSeq, changes, truncated });
+  } catch (e) {
+    res.status(500).json({ error: e.toString() });
+  }
+});
+
+// =================== CHECKSUM ===================
+// Rangos sobre el _id (ObjectId como entero de 96 bits, en decimal en from/to).
+// Hash por fila = MD5 de los campos; hash de un rango = XOR de los primeros 64 bits.
+const CHECKSUM_FIELDS = {
+  exams: ["type", "specialty", "date"],
+  students: ["name", "age", "exam_id"],
+};
+const MAX_CHECKSUM_PARTS = 256n;
+const MAX_CHECKSUM_ROWS = 5000;
+const OID_LIMIT = 1n << 96n;
+
+const oidToBig = (id) => BigInt("0x" + id.toHexString());
+const bigToOid = (n) => new ObjectId(n.toString(16).padStart(24, "0"));
+// <longitud>:<valor> (en caracteres, como ms1/ms2), o \N si es null/ausente: ni un "|" dentro
+// de un valor ni un null pueden hacer que dos documentos distintos den el mismo texto
+const hashField = (v) => (v == null ? "\\N" : `${[...String(v)].length}:${String(v)}`);
+const rowHash = (doc, fields) =>
+  crypto
+    .createHash("md5")
+    .update([doc._id.toHexString(), ...fields.map((f) => hashField(doc[f]))].join("|"))
+    .digest("hex");
+
+function idRange(from, to) {
+  const range = {};
+  if (from > 0n) range.$gte = bigToOid(from);
+  if (to < OID_LIMIT) range.$lt = bigToOid(to);
+  return Object.keys(range).length ? { _id: range } : {};
+}
+
+/**
+ * @swagger
+ * /checksum:
+ *   get:
+ *     summary: Hash de los documentos con _id en [from, to) y de "parts" sub-rangos (sin from/to devuelve límites y hash global)
+ *     parameters:
+ *       - in: query
+ *         name: table
+ *         schema: { type: string, enum: [exams, students], default: exams }
+ *       - in: query
+ *         name: from
+ *         schema: { type: string }
+ *       - in: query
+ *         name: to
+ *         schema: { type: string }
+ *       - in: query
+ *         name: parts
+ *         schema: { type: integer, default: 1 }
+ *       - in: query
+ *         name: rows
+ *         schema: { type: integer }
+ *         description: 1 = incluir id y hash de cada documento (máx. 5000)
+ */
+app.get("/checksum", async (req, res) => {
+  try {
+    const table = req.query.table || "exams";
+    const fields = CHECKSUM_FIELDS[table];
+    if (!fields) return res.status(400).json({ error: "Unknown table" });
+    const projection = Object.fromEntries(fields.map((f) => [f, 1]));
+    const whole = req.query.from === undefined || req.query.to === undefined;
+    const from = whole ? 0n : BigInt(req.query.from);
+    const to = whole ? OID_LIMIT : BigInt(req.query.to);
+    let parts = whole ? 1n : BigInt(parseInt(req.query.parts, 10) || 1);
+    if (parts < 1n) parts = 1n;
+    if (parts > MAX_CHECKSUM_PARTS) parts = MAX_CHECKSUM_PARTS;
+    let step = (to - from + parts - 1n) / parts;
+    if (step < 1n) step = 1n;
+
+    const chunks = new Map();
+    const rows = [];
+    let count = 0;
+    let total = 0n;
+    let lo = null;
+    let hi = null;
+    const cursor = db
+      .collection(table)
+      .find(idRange(from, to), { projection })
+      .sort({ _id: 1 });
+    for await (const doc of cursor) {
+      const h = rowHash(doc, fields);
+      const key = oidToBig(doc._id);
+      const value = BigInt("0x" + h.slice(0, 16));
+      if (lo === null) lo = key;
+      hi = key;
+      count++;
+      total ^= value;
+      const part = (key - from) / step;
+      const c = chunks.get(part) || { count: 0, hash: 0n };
+      c.count++;
+      c.hash ^= value;
+      chunks.set(part, c);
+      if (req.query.rows === "1" && rows.length < MAX_CHECKSUM_ROWS)
+        rows.push({ id: doc._id.toHexString(), hash: h });
+    }
+
+    if (whole) {
+      return res.json({
+        table,
+        from: lo === null ? "0" : lo.toString(),
+        to: hi === null ? "0" : (hi + 1n).toString(),
+        count,
+        hash: total.toString(16),
+      });
+    }
+    const body = {
+      table,
+      from: from.toString(),
+      to: to.toString(),
+      count,
+      hash: total.toString(16),
+      chunks: [...chunks.entries()].map(([part, c]) => {
+        const start = from + part * step;
+        const end = start + step < to ? start + step : to;
+        return { from: start.toString(), to: end.toString(), count: c.count, hash: c.hash.toString(16) };
+      }),
+    };
+    if (req.query.rows === "1") body.rows = rows;
+    res.json(body);
+  } catch (e) {
+    res.status(400).json({ error: e.toString() });
+  }
+});
+
 // ---------- Root ----------
 app.get("/", (req, res) => {
   res.json({
     status: "ok",
     swagger_ui: "/api-docs",
-    collections: ["exams", "students"],
+    collections: ["exams", "students", "changes"],
     relation: "1:N (exam -> students)",
   });
 });
@@ -1,5 +1,6 @@
-from flask import Flask, jsonify, request
-import requests, os
+from flask import Flask, jsonify, request, Response
+import requests, os, threading, time, json, queue
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from flasgger import Swagger
 
 app = Flask(__name__)
@@ -20,6 +21,355 @@ ENV_CONFIG = {
     },
 }
 
+# ---- Resiliencia de llamadas upstream (env vars) ----
+UPSTREAM_TIMEOUT = float(os.getenv("UPSTREAM_TIMEOUT", "2"))    # seg. por intento
+REQUEST_DEADLINE = float(os.getenv("REQUEST_DEADLINE", "3"))    # seg. para toda la petición
+HEDGE_AFTER = float(os.getenv("HEDGE_AFTER", "0"))              # seg. antes del reintento "hedged" (0 = desactivado)
+BREAKER_FAILURES = int(os.getenv("BREAKER_FAILURES", "3"))      # fallos seguidos para abrir el circuito
+BREAKER_RESET = float(os.getenv("BREAKER_RESET", "15"))         # seg. abierto antes de probar de nuevo
+UPSTREAM_WORKERS = int(os.getenv("UPSTREAM_WORKERS", "32"))
+
+EXECUTOR = ThreadPoolExecutor(max_workers=UPSTREAM_WORKERS)
+_local = threading.local()
+
+
+class CircuitBreaker:
+    """Circuit breaker simple: closed -> open tras N fallos -> half_open (1 prueba) -> closed."""
+
+    def __init__(self, failures=BREAKER_FAILURES, reset=BREAKER_RESET):
+        self.max_failures = failures
+        self.reset = reset
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.lock = threading.Lock()
+
+    def allow(self):
+        with self.lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.reset:
+                self.state = "half_open"   # deja pasar una sola petición de prueba
+                return True
+            return False
+
+    def success(self):
+        with self.lock:
+            self.state = "closed"
+            self.failures = 0
+
+    def failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.state == "half_open" or self.failures >= self.max_failures:
+                self.state = "open"
+                self.opened_at = time.monotonic()
+
+    def release(self):
+        """La prueba de half_open no llegó a ejecutarse: vuelve a open y se probará tras `reset`"""
+        with self.lock:
+            if self.state == "half_open":
+                self.state = "open"
+                self.opened_at = time.monotonic()
+
+    def snapshot(self):
+        with self.lock:
+            return {"state": self.state, "failures": self.failures}
+
+
+BREAKERS = {(env, svc): CircuitBreaker() for env, cfg in ENV_CONFIG.items() for svc in cfg}
+
+
+def _session():
+    # una sesión por hilo para reutilizar conexiones keep-alive
+    s = getattr(_local, "session", None)
+    if s is None:
+        s = _local.session = requests.Session()
+    return s
+
+
+def _get_json(url, timeout):
+    r = _session().get(url, timeout=timeout)
+    r.raise_for_status()
+    return r.json()
+
+
+class _CallOutcome:
+    """
+    Resultado de una llamada (uno o dos intentos si hay hedging) para el breaker:
+    cuenta un solo éxito o un solo fallo por llamada, y solo a partir de lo que
+    respondió el upstream (error o su propio timeout), nunca por el deadline del
+    llamador ni por la espera en el pool de ms4.
+    """
+
+    def __init__(self, breaker):
+        self.breaker = breaker
+        self.lock = threading.Lock()
+        self.running = 0
+        self.failed = False
+        self.closed = False      # ya no se lanzarán más intentos
+        self.reported = False
+
+    def start(self):
+        with self.lock:
+            self.running += 1
+
+    def finished(self, ok):
+        """ok: True/False según el upstream; None si el intento no llegó a ejecutarse"""
+        with self.lock:
+            self.running -= 1
+            if ok and not self.reported:
+                self.reported = True
+                if self.breaker:
+                    self.breaker.success()
+            elif ok is False:
+                self.failed = True
+            self._maybe_report()
+
+    def close(self):
+        with self.lock:
+            self.closed = True
+            self._maybe_report()
+
+    def _maybe_report(self):
+        if self.closed and not self.running and not self.reported:
+            self.reported = True
+            if not self.breaker:
+                return
+            if self.failed:
+                self.breaker.failure()
+            else:
+                # ningún intento llegó al upstream: se devuelve el hueco de prueba de half_open
+                self.breaker.release()
+
+
+def _attempt(outcome, url, timeout, deadline):
+    if time.monotonic() >= deadline:
+        # el llamador ya se rindió mientras el intento esperaba en el pool
+        outcome.finished(None)
+        raise TimeoutError("deadline expired before the request started")
+    try:
+        data = _get_json(url, timeout)
+    except Exception:
+        outcome.finished(False)
+        raise
+    outcome.finished(True)
+    return data
+
+
+def fan_out(calls, deadline=None, timeout=UPSTREAM_TIMEOUT, executor=EXECUTOR, use_breakers=True):
+    """
+    Ejecuta en paralelo las llamadas {nombre: (env, servicio, path)} respetando
+    circuit breakers, deadline global y hedging opcional (como mucho un intento extra).
+    Devuelve (results, sources): datos por nombre y estado por fuente.
+    """
+    deadline = time.monotonic() + (REQUEST_DEADLINE if deadline is None else deadline)
+    results = {name: None for name in calls}
+    sources = {}
+    pending = {}      # future -> nombre
+    running = {}      # nombre -> nº de intentos en curso
+    started = {}      # nombre -> instante del primer intento
+    outcomes = {}     # nombre -> _CallOutcome
+    final = set()     # nombres que ya no admiten otro intento (hedge enviado o no permitido)
+
+    def submit(name):
+        env, svc, path = calls[name]
+        outcomes[name].start()
+        running[name] = running.get(name, 0) + 1
+        url = f"{ENV_CONFIG[env][svc]}{path}"
+        pending[executor.submit(_attempt, outcomes[name], url, timeout, deadline)] = name
+
+    def finalize(name):
+        final.add(name)
+        outcomes[name].close()
+
+    for name, (env, svc, _) in calls.items():
+        breaker = BREAKERS[(env, svc)] if use_breakers else None
+        if breaker and not breaker.allow():
+            sources[name] = {"status": "circuit_open"}
+            continue
+        outcomes[name] = _CallOutcome(breaker)
+        started[name] = time.monotonic()
+        submit(name)
+        # en half_open solo viaja la petición de prueba, sin hedge
+        if HEDGE_AFTER <= 0 or (breaker and breaker.state == "half_open"):
+            finalize(name)
+
+    while pending and any(name not in sources for name in started):
+        now = time.monotonic()
+        if now >= deadline:
+            break
+        wake = deadline - now
+        for name, t0 in started.items():
+            if name in sources or name in final:
+                continue
+            if now - t0 >= HEDGE_AFTER:
+                submit(name)    # segundo intento en paralelo, gana el primero
+                finalize(name)
+            else:
+                wake = min(wake, t0 + HEDGE_AFTER - now)
+        done, _ = wait(list(pending), timeout=wake, return_when=FIRST_COMPLETED)
+        for fut in done:
+            name = pending.pop(fut)
+            running[name] -= 1
+            if name in sources:
+                continue    # ya resuelto por otro intento
+            elapsed = round((time.monotonic() - started[name]) * 1000)
+            try:
+                results[name] = fut.result()
+            except Exception as e:
+                if running[name] == 0:
+                    # sin intentos en curso: un error no se reintenta
+                    finalize(name)
+                    sources[name] = {"status": "error", "error": str(e), "ms": elapsed}
+                continue
+            sources[name] = {"status": "ok", "ms": elapsed}
+
+    # lo que no respondió a tiempo se informa como timeout; los intentos abandonados
+    # terminan solos y entonces informan al breaker de su resultado real
+    for name in started:
+        if name not in final:
+            finalize(name)
+        if name not in sources:
+            sources[name] = {"status": "timeout"}
+    return results, sources
+
+
+# ---- Change feed (SSE) ----
+FEED_POLL_INTERVAL = float(os.getenv("FEED_POLL_INTERVAL", "1"))   # seg. entre lecturas de /changes
+FEED_HEARTBEAT = float(os.getenv("FEED_HEARTBEAT", "15"))          # seg. entre comentarios keep-alive
+FEED_GAP_TIMEOUT = float(os.getenv("FEED_GAP_TIMEOUT", "5"))       # seg. de espera por un hueco en seq
+FEED_QUEUE_SIZE = int(os.getenv("FEED_QUEUE_SIZE", "1000"))        # eventos pendientes por cliente
+FEED_MAX_SUBSCRIBERS = int(os.getenv("FEED_MAX_SUBSCRIBERS", "100"))  # clientes SSE por worker (gunicorn.conf.py lo ajusta)
+
+
+class ChangeFeed:
+    """
+    Un hilo por entorno lee los change-logs de MS1/MS2/MS3 (`/changes?since=`)
+    y reparte los cambios a todos los clientes SSE conectados a este worker.
+    El hilo solo corre mientras haya clientes.
+
+    Cada cliente recibe primero un evento `ready` con las secuencias desde las que
+    se le enviarán cambios; todo lo anterior ya está en la BD, así que el snapshot
+    que cargue después de `ready` no deja huecos.
+    """
+
+    SOURCES = {"users": "MS1", "patients": "MS2", "exams": "MS3"}
+
+    def __init__(self, env):
+        self.env = env
+        self.subscribers = set()
+        self.thread = None
+        self.positions = None    # {fuente: seq} una vez hecha la primera lectura
+        self.lock = threading.Lock()
+
+    def subscribe(self):
+        """Devuelve la cola del cliente, o None si este worker ya tiene FEED_MAX_SUBSCRIBERS"""
+        q = queue.Queue(maxsize=FEED_QUEUE_SIZE)
+        with self.lock:
+            if len(self.subscribers) >= FEED_MAX_SUBSCRIBERS:
+                return None
+            self.subscribers.add(q)
+            if self.positions is not None:
+                q.put_nowait(("ready", dict(self.positions)))
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, daemon=True)
+                self.thread.start()
+        return q
+
+    def unsubscribe(self, q):
+        with self.lock:
+            self.subscribers.discard(q)
+
+    def _publish(self, event):
+        with self.lock:
+            subscribers = list(self.subscribers)
+        for q in subscribers:
+            try:
+                q.put_nowait(event)
+            except queue.Full:
+                # cliente demasiado lento: se le corta y al reconectar recarga el snapshot
+                self.unsubscribe(q)
+                with q.mutex:
+                    q.queue.clear()
+                q.put_nowait(None)
+
+    @staticmethod
+    def _advance(cursor, changes):
+        """
+        Devuelve los cambios nuevos y avanza el cursor solo sobre secuencias contiguas:
+        un hueco puede ser una transacción que aún no hizo commit. Si el hueco dura más
+        de FEED_GAP_TIMEOUT se asume rollback y se salta.
+        """
+        fresh = [c for c in changes if c["seq"] > cursor["seq"] and c["seq"] not in cursor["seen"]]
+        cursor["seen"].update(c["seq"] for c in fresh)
+        while cursor["seq"] + 1 in cursor["seen"]:
+            cursor["seq"] += 1
+            cursor["seen"].discard(cursor["seq"])
+        if not cursor["seen"]:
+            cursor["gap_since"] = None
+        elif cursor["gap_since"] is None:
+            cursor["gap_since"] = time.monotonic()
+        elif time.monotonic() - cursor["gap_since"] > FEED_GAP_TIMEOUT:
+            cursor["seq"] = min(cursor["seen"])
+            cursor["seen"].discard(cursor["seq"])
+            cursor["gap_since"] = None
+            while cursor["seq"] + 1 in cursor["seen"]:
+                cursor["seq"] += 1
+                cursor["seen"].discard(cursor["seq"])
+        return fresh
+
+    def _reset(self, name, seq):
+        """Evento para que los clientes recarguen el snapshot de una fuente"""
+        self._publish(("change", {"source": name, "seq": seq, "entity": None,
+                                  "entity_id": None, "op": "reset", "data": None}))
+
+    def _poll(self, cursors):
+        calls = {}
+        for name, svc in self.SOURCES.items():
+            since = f"?since={cursors[name]['seq']}" if name in cursors else ""
+            calls[name] = (self.env, svc, f"/changes{since}")
+        results, _ = fan_out(calls)
+        for name, data in results.items():
+            if data is None:
+                continue
+            if name not in cursors or data.get("truncated"):
+                # primera lectura: se empieza desde el último cambio existente
+                first = name not in cursors
+                cursors[name] = {"seq": data["last_seq"], "seen": set(), "gap_since": None}
+                if not first or self.positions is not None:
+                    # fuente que no respondía al arrancar, o cambios ya purgados del change-log:
+                    # los clientes recargan su snapshot
+                    self._reset(name, data["last_seq"])
+                continue
+            for change in self._advance(cursors[name], data["changes"]):
+                self._publish(("change", dict(change, source=name)))
+        with self.lock:
+            first = self.positions is None
+            self.positions = {name: c["seq"] for name, c in cursors.items()}
+            if first:
+                for q in self.subscribers:
+                    q.put_nowait(("ready", dict(self.positions)))
+
+    def _run(self):
+        cursors = {}
+        while True:
+            with self.lock:
+                if not self.subscribers:
+                    self.thread = None
+                    self.positions = None
+                    return
+            try:
+                self._poll(cursors)
+            except Exception as e:
+                # respuesta inesperada de un upstream: el hilo sigue vivo y reintenta
+                print(f"feed {self.env}: poll failed:", e, flush=True)
+            time.sleep(FEED_POLL_INTERVAL)
+
+
+FEEDS = {env: ChangeFeed(env) for env in ENV_CONFIG}
+
+
 @app.get("/")
 def index():
     return jsonify({
@@ -39,29 +389,47 @@ def aggregate():
         type: string
         required: false
         description: Entorno a usar (prod1 o prod2)
+      - name: deadline
+        in: query
+        type: number
+        required: false
+        description: Tiempo máximo total en segundos, en (0, REQUEST_DEADLINE] (default REQUEST_DEADLINE)
     responses:
       200:
-        description: Datos agregados del entorno seleccionado
+        description: Datos agregados (status=partial si alguna fuente falló)
+      400:
+        description: Entorno o deadline inválido
+      503:
+        description: Ninguna fuente respondió
     """
     env = request.args.get("env", "prod1")
-    cfg = ENV_CONFIG.get(env)
-    if not cfg:
+    if env not in ENV_CONFIG:
         return jsonify({"error": "Entorno inválido"}), 400
+    deadline = request.args.get("deadline", type=float)
+    if deadline is not None:
+        if deadline <= 0:
+            return jsonify({"error": "deadline debe ser > 0"}), 400
+        deadline = min(deadline, REQUEST_DEADLINE)
 
-    try:
-        users = requests.get(f"{cfg['MS1']}/users", timeout=5).json()
-        patients = requests.get(f"{cfg['MS2']}/patients", timeout=5).json()
-        exams = requests.get(f"{cfg['MS3']}/exams", timeout=5).json()
+    results, sources = fan_out({
+        "users": (env, "MS1", "/users"),
+        "patients": (env, "MS2", "/patients"),
+        "exams": (env, "MS3", "/exams"),
+    }, deadline)
 
-        return jsonify({
-            "environment": env,
-            "users_sample": users[:3],
-            "patients_sample": patients[:3],
-            "exams_sample": exams[:3],
-            "status": "aggregated"
-        })
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
+    ok = [name for name, src in sources.items() if src["status"] == "ok"]
+    body = {
+        "environment": env,
+        "users_sample": (results["users"] or [])[:3],
+        "patients_sample": (results["patients"] or [])[:3],
+        "exams_sample": (results["exams"] or [])[:3],
+        "sources": sources,
+        "status": "aggregated" if len(ok) == len(sources) else "partial",
+    }
+    if not ok:
+        body["status"] = "unavailable"
+        return jsonify(body), 503
+    return jsonify(body)
 
 
 @app.get("/compare")
@@ -73,18 +441,213 @@ def compare():
       200:
         description: Diferencias entre entornos
     """
+    calls = {}
+    for env in ENV_CONFIG:
+        calls[(env, "users")] = (env, "MS1", "/users")
+        calls[(env, "patients")] = (env, "MS2", "/patients")
+        calls[(env, "exams")] = (env, "MS3", "/exams")
+    results, sources = fan_out(calls)
+
     result = {}
-    for env, cfg in ENV_CONFIG.items():
+    for (env, name), data in results.items():
+        entry = result.setdefault(env, {"sources": {}})
+        entry[name] = len(data) if data is not None else None
+        entry["sources"][name] = sources[(env, name)]
+
+    return jsonify(result)
+
+
+@app.get("/feed")
+def feed():
+    """
+    Feed de cambios (Server-Sent Events) de users, patients y exams
+    ---
+    parameters:
+      - name: env
+        in: query
+        type: string
+        required: false
+        description: Entorno a usar (prod1 o prod2)
+    produces:
+      - text/event-stream
+    responses:
+      200:
+        description: "Primero `ready` con {fuente: seq}; después eventos `change` con {source, seq, entity, entity_id, op, data}"
+      503:
+        description: Demasiados clientes conectados a este worker (reintentar más tarde)
+    """
+    env = request.args.get("env", "prod1")
+    if env not in FEEDS:
+        return jsonify({"error": "Entorno inválido"}), 400
+    q = FEEDS[env].subscribe()
+    if q is None:
+        return jsonify({"error": "Demasiados clientes del feed"}), 503, {"Retry-After": "10"}
+
+    def stream():
         try:
-            u = len(requests.get(f"{cfg['MS1']}/users", timeout=5).json())
-            p = len(requests.get(f"{cfg['MS2']}/patients", timeout=5).json())
-            e = len(requests.get(f"{cfg['MS3']}/exams", timeout=5).json())
-            result[env] = {"users": u, "patients": p, "exams": e}
-        except Exception as err:
-            result[env] = {"error": str(err)}
+            yield "retry: 3000\n\n"
+            while True:
+                try:
+                    item = q.get(timeout=FEED_HEARTBEAT)
+                except queue.Empty:
+                    yield ": ping\n\n"
+                    continue
+                if item is None:
+                    return
+                kind, event = item
+                yield f"event: {kind}\ndata: {json.dumps(event)}\n\n"
+        finally:
+            FEEDS[env].unsubscribe(q)
+
+    return Response(stream(), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
 
+# ---- Reconciliación por hashes de rangos (estilo Merkle) ----
+RECONCILE_SOURCES = {
+    "users": ("MS1", "users"),
+    "addresses": ("MS1", "addresses"),
+    "patients": ("MS2", "patients"),
+    "appointments": ("MS2", "appointments"),
+    "exams": ("MS3", "exams"),
+    "students": ("MS3", "students"),
+}
+RECONCILE_PARTS = int(os.getenv("RECONCILE_PARTS", "16"))     # sub-rangos por nivel
+RECONCILE_LEAF = int(os.getenv("RECONCILE_LEAF", "64"))       # rangos con menos filas se comparan fila a fila
+RECONCILE_DEADLINE = float(os.getenv("RECONCILE_DEADLINE", "10"))  # seg. por lote y por llamada
+RECONCILE_WORKERS = int(os.getenv("RECONCILE_WORKERS", "8"))
+
+# pool propio y sin circuit breakers: una reconciliación lenta no debe agotar los
+# hilos de /aggregate y el feed ni abrir sus circuitos
+RECONCILE_EXECUTOR = ThreadPoolExecutor(max_workers=RECONCILE_WORKERS)
+
+
+class ReconcileError(Exception):
+    def __init__(self, sources):
+        super().__init__("upstream unavailable")
+        self.sources = sources
+
+
+def _checksums(envs, svc, table, ranges, stats, **params):
+    """
+    Pide /checksum de cada rango a los dos entornos: {(env, (lo, hi)): respuesta}.
+    Los rangos van en lotes de RECONCILE_PARTS, cada lote en paralelo con su propio deadline.
+    """
+    query = "".join(f"&{k}={v}" for k, v in params.items())
+    results = {}
+    for start in range(0, len(ranges), RECONCILE_PARTS):
+        calls = {}
+        for lo, hi in ranges[start:start + RECONCILE_PARTS]:
+            for env in envs:
+                rng = f"&from={lo}&to={hi}" if lo is not None else ""
+                calls[(env, (lo, hi))] = (env, svc, f"/checksum?table={table}{rng}{query}")
+        batch, sources = fan_out(calls, RECONCILE_DEADLINE, timeout=RECONCILE_DEADLINE,
+                                 executor=RECONCILE_EXECUTOR, use_breakers=False)
+        failed = {f"{env} {lo}-{hi}": src for (env, (lo, hi)), src in sources.items() if src["status"] != "ok"}
+        if failed:
+            raise ReconcileError(failed)
+        stats["requests"] += len(calls)
+        stats["bytes"] += sum(len(json.dumps(r)) for r in batch.values())
+        results.update(batch)
+    return results
+
+
+def reconcile_source(source, env_a, env_b):
+    svc, table = RECONCILE_SOURCES[source]
+    envs = (env_a, env_b)
+    stats = {"requests": 0, "bytes": 0, "levels": 0}
+    result = {"source": source, "envs": list(envs), "identical": True,
+              f"only_in_{env_a}": [], f"only_in_{env_b}": [], "different": [], "stats": stats}
+
+    roots = _checksums(envs, svc, table, [(None, None)], stats)
+    a, b = roots[(env_a, (None, None))], roots[(env_b, (None, None))]
+    result["count"] = {env_a: a["count"], env_b: b["count"]}
+    if (a["count"], a["hash"]) == (b["count"], b["hash"]):
+        return result
+    result["identical"] = False
+
+    # rangos de ids con límites enteros (ms3 los devuelve como string por ser de 96 bits)
+    bounds = [(int(r["from"]), int(r["to"])) for r in (a, b) if r["count"]]
+    pending = [(min(lo for lo, _ in bounds), max(hi for _, hi in bounds))]
+    leaves = []
+    while pending:
+        stats["levels"] += 1
+        level = _checksums(envs, svc, table, pending, stats, parts=RECONCILE_PARTS)
+        pending = []
+        for lo, hi in {rng for _, rng in level}:
+            chunks = [{(int(c["from"]), int(c["to"])): c for c in level[(env, (lo, hi))]["chunks"]} for env in envs]
+            for rng in set(chunks[0]) | set(chunks[1]):
+                ca, cb = (c.get(rng, {"count": 0, "hash": "0"}) for c in chunks)
+                if (ca["count"], ca["hash"]) == (cb["count"], cb["hash"]):
+                    continue
+                if max(ca["count"], cb["count"]) <= RECONCILE_LEAF or rng[1] - rng[0] <= 1:
+                    leaves.append(rng)
+                else:
+                    pending.append(rng)
+
+    # hojas: hashes por fila para obtener los ids exactos
+    rows = _checksums(envs, svc, table, leaves, stats, rows=1)
+    for rng in leaves:
+        ha = {r["id"]: r["hash"] for r in rows[(env_a, rng)]["rows"]}
+        hb = {r["id"]: r["hash"] for r in rows[(env_b, rng)]["rows"]}
+        result[f"only_in_{env_a}"] += [i for i in ha if i not in hb]
+        result[f"only_in_{env_b}"] += [i for i in hb if i not in ha]
+        result["different"] += [i for i in ha if i in hb and ha[i] != hb[i]]
+    for key in (f"only_in_{env_a}", f"only_in_{env_b}", "different"):
+        result[key].sort()
+    return result
+
+
+@app.get("/reconcile")
+def reconcile():
+    """
+    Ids exactos que difieren entre dos entornos, comparando hashes de rangos de ids
+    ---
+    parameters:
+      - name: source
+        in: query
+        type: string
+        enum: [users, addresses, patients, appointments, exams, students]
+        default: users
+      - name: envs
+        in: query
+        type: string
+        required: false
+        description: Dos entornos separados por coma (default prod1,prod2)
+    responses:
+      200:
+        description: only_in_<env>, different y estadísticas de transferencia
+      400:
+        description: Parámetros inválidos
+      503:
+        description: Algún upstream no respondió
+    """
+    source = request.args.get("source", "users")
+    envs = request.args.get("envs", ",".join(list(ENV_CONFIG)[:2])).split(",")
+    if source not in RECONCILE_SOURCES:
+        return jsonify({"error": "Fuente inválida"}), 400
+    if len(envs) != 2 or envs[0] == envs[1] or any(e not in ENV_CONFIG for e in envs):
+        return jsonify({"error": "Entornos inválidos"}), 400
+    try:
+        return jsonify(reconcile_source(source, *envs))
+    except ReconcileError as e:
+        return jsonify({"error": str(e), "sources": e.sources}), 503
+
+
+@app.get("/breakers")
+def breakers():
+    """
+    Estado de los circuit breakers por entorno y servicio
+    ---
+    responses:
+      200:
+        description: Estado (closed/open/half_open) de cada upstream
+    """
+    result = {}
+    for (env, svc), br in BREAKERS.items():
+        result.setdefault(env, {})[svc] = br.snapshot()
     return jsonify(result)
 
 
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=5004)
+    app.run(host="0.0.0.0", port=int(os.getenv("PORT", "5004")))
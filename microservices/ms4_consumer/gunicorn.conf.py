@@ -0,0 +1,34 @@
+# gunicorn.conf.py - modo producción (reemplaza al servidor de desarrollo de Flask)
+# Uso: gunicorn -c gunicorn.conf.py app:app
+# Recarga sin cortar peticiones: kill -HUP <pid master>
+# ms4 es I/O-bound (espera a MS1/MS2/MS3) y mantiene conexiones SSE abiertas (/feed):
+# por defecto usa gevent, donde cada dashboard conectado cuesta un greenlet y no un hilo.
+# Los circuit breakers viven en memoria, uno por worker.
+import os
+
+worker_class = os.getenv("WORKER_CLASS", "gevent")                  # gevent | gthread | sync
+if worker_class == "gevent":
+    # parchear antes de que preload importe la app (threading, sockets, ssl)
+    from gevent import monkey
+    monkey.patch_all()
+
+import multiprocessing  # noqa: E402
+
+cores = multiprocessing.cpu_count()
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5004')}"
+workers = int(os.getenv("WEB_CONCURRENCY", cores + 1))
+threads = int(os.getenv("THREADS", "8"))                            # solo aplica a gthread
+worker_connections = int(os.getenv("WORKER_CONNECTIONS", "1000"))   # solo aplica a gevent
+preload_app = os.getenv("PRELOAD", "1") == "1"
+
+# tope de clientes SSE por worker; con gthread se reserva la mitad de los hilos para la API
+os.environ.setdefault("FEED_MAX_SUBSCRIBERS", str(worker_connections // 2 if worker_class == "gevent" else max(1, threads // 2)))
+
+timeout = int(os.getenv("TIMEOUT", "30"))
+graceful_timeout = int(os.getenv("GRACEFUL_TIMEOUT", "20"))
+keepalive = int(os.getenv("KEEPALIVE", "5"))
+max_requests = int(os.getenv("MAX_REQUESTS", "5000"))
+max_requests_jitter = int(os.getenv("MAX_REQUESTS_JITTER", "500"))
+accesslog = os.getenv("ACCESS_LOG", "-")
+loglevel = os.getenv("LOG_LEVEL", "info")
@@ -0,0 +1,87 @@
+# Pruebas de ChangeFeed con _get_json simulado (sin upstreams reales)
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import app as ms4  # noqa: E402
+
+
+@pytest.fixture
+def feed(monkeypatch):
+    monkeypatch.setattr(ms4, "BREAKERS", {key: ms4.CircuitBreaker() for key in ms4.BREAKERS})
+    monkeypatch.setattr(ms4, "FEED_POLL_INTERVAL", 0.01)
+    log = {"/users": [], "/patients": [], "/exams": []}
+    base = {ms4.ENV_CONFIG["prod1"][svc]: path for path, svc in
+            (("/users", "MS1"), ("/patients", "MS2"), ("/exams", "MS3"))}
+
+    def fake_get_json(url, timeout):
+        host, _, query = url.partition("/changes")
+        changes = log[base[host]]
+        since = int(query.split("since=")[1]) if "since=" in query else None
+        return {"last_seq": max([c["seq"] for c in changes], default=0),
+                "changes": [c for c in changes if since is not None and c["seq"] > since]}
+
+    monkeypatch.setattr(ms4, "_get_json", fake_get_json)
+    f = ms4.ChangeFeed("prod1")
+    yield f, log
+    f.subscribers.clear()
+
+
+def test_ready_carries_start_positions_then_changes(feed):
+    f, log = feed
+    log["/users"].append({"seq": 7, "entity": "user", "entity_id": 7, "op": "create", "data": {"id": 7}})
+    q = f.subscribe()
+    assert q.get(timeout=2) == ("ready", {"users": 7, "patients": 0, "exams": 0})
+    log["/users"].append({"seq": 8, "entity": "user", "entity_id": 8, "op": "delete", "data": None})
+    kind, event = q.get(timeout=2)
+    assert kind == "change"
+    assert (event["source"], event["seq"], event["op"]) == ("users", 8, "delete")
+
+
+def test_late_subscriber_gets_ready_immediately(feed):
+    f, _ = feed
+    first = f.subscribe()
+    assert first.get(timeout=2)[0] == "ready"
+    late = f.subscribe()
+    assert late.get_nowait()[0] == "ready"
+
+
+def test_subscriber_cap(feed, monkeypatch):
+    f, _ = feed
+    monkeypatch.setattr(ms4, "FEED_MAX_SUBSCRIBERS", 1)
+    assert f.subscribe() is not None
+    assert f.subscribe() is None
+
+
+def test_poller_survives_unexpected_payload(feed, monkeypatch):
+    f, log = feed
+    q = f.subscribe()
+    assert q.get(timeout=2)[0] == "ready"
+    good = ms4._get_json
+    monkeypatch.setattr(ms4, "_get_json", lambda url, timeout: {"unexpected": True})
+    time.sleep(0.05)
+    monkeypatch.setattr(ms4, "_get_json", good)
+    log["/exams"].append({"seq": 1, "entity": "exam", "entity_id": "a", "op": "create", "data": {}})
+    kind, event = q.get(timeout=2)
+    assert (kind, event["source"], event["seq"]) == ("change", "exams", 1)
+    assert f.thread is not None and f.thread.is_alive()
+
+
+def test_truncated_change_log_emits_reset(feed, monkeypatch):
+    f, _ = feed
+    q = f.subscribe()
+    assert q.get(timeout=2)[0] == "ready"
+    good = ms4._get_json
+
+    def purged(url, timeout):
+        data = good(url, timeout)
+        if "/changes?since=" in url and url.startswith(ms4.ENV_CONFIG["prod1"]["MS1"]):
+            return {"last_seq": 90, "changes": [], "truncated": True}
+        return data
+
+    monkeypatch.setattr(ms4, "_get_json", purged)
+    kind, event = q.get(timeout=2)
+    assert (kind, event["source"], event["op"], event["seq"]) == ("change", "users", "reset", 90)
@@ -0,0 +1,87 @@
+# Pruebas de reconcile_source contra un /checksum simulado sobre tablas en memoria
+import hashlib
+import os
+import sys
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import app as ms4  # noqa: E402
+
+
+def row_hash(i, value):
+    return hashlib.md5(f"{i}|{value}".encode()).hexdigest()
+
+
+def fake_checksum(table, args):
+    """Mismo contrato que /checksum de ms1: raíz sin from/to, sub-rangos con parts y rows=1"""
+    if "from" not in args:
+        ids = sorted(table)
+        total = 0
+        for i in ids:
+            total ^= int(row_hash(i, table[i])[:16], 16)
+        return {"from": ids[0] if ids else 0, "to": ids[-1] + 1 if ids else 0,
+                "count": len(ids), "hash": format(total, "x")}
+    lo, hi = int(args["from"]), int(args["to"])
+    parts = int(args.get("parts", 1))
+    step = max(1, -(-(hi - lo) // parts))
+    chunks = {}
+    for i in sorted(table):
+        if lo <= i < hi:
+            start = lo + (i - lo) // step * step
+            c = chunks.setdefault(start, {"from": start, "to": min(hi, start + step), "count": 0, "hash": 0})
+            c["count"] += 1
+            c["hash"] ^= int(row_hash(i, table[i])[:16], 16)
+    body = {"from": lo, "to": hi, "chunks": [dict(c, hash=format(c["hash"], "x")) for c in chunks.values()]}
+    if args.get("rows") == "1":
+        body["rows"] = [{"id": i, "hash": row_hash(i, table[i])} for i in sorted(table) if lo <= i < hi]
+    return body
+
+
+@pytest.fixture
+def tables(monkeypatch):
+    monkeypatch.setattr(ms4, "RECONCILE_PARTS", 4)
+    monkeypatch.setattr(ms4, "RECONCILE_LEAF", 8)
+    monkeypatch.setattr(ms4, "HEDGE_AFTER", 0)
+    data = {"prod1": {}, "prod2": {}}
+    hosts = {ms4.ENV_CONFIG[env]["MS1"]: env for env in data}
+
+    def fake_get_json(url, timeout):
+        parts = urlsplit(url)
+        args = {k: v[0] for k, v in parse_qs(parts.query).items()}
+        return fake_checksum(data[hosts[f"{parts.scheme}://{parts.netloc}"]], args)
+
+    monkeypatch.setattr(ms4, "_get_json", fake_get_json)
+    return data
+
+
+def test_identical_tables_stop_at_the_root(tables):
+    tables["prod1"].update({i: f"user{i}" for i in range(1, 300)})
+    tables["prod2"].update(tables["prod1"])
+    result = ms4.reconcile_source("users", "prod1", "prod2")
+    assert result["identical"]
+    assert result["stats"]["requests"] == 2
+
+
+def test_missing_extra_and_modified_ids(tables):
+    tables["prod1"].update({i: f"user{i}" for i in range(1, 1000)})
+    tables["prod2"].update(tables["prod1"])
+    del tables["prod2"][17]                    # solo en prod1
+    tables["prod2"][1500] = "new"              # solo en prod2, más allá del máximo de prod1
+    tables["prod2"][250] = "renamed"           # distinto
+    tables["prod1"][999] = "changed"           # distinto, en el último rango
+    result = ms4.reconcile_source("users", "prod1", "prod2")
+    assert not result["identical"]
+    assert result["only_in_prod1"] == [17]
+    assert result["only_in_prod2"] == [1500]
+    assert result["different"] == [250, 999]
+    assert result["stats"]["levels"] > 1
+
+
+def test_one_env_empty(tables):
+    tables["prod1"].update({i: f"user{i}" for i in range(5, 40)})
+    result = ms4.reconcile_source("users", "prod1", "prod2")
+    assert result["count"] == {"prod1": 35, "prod2": 0}
+    assert result["only_in_prod1"] == list(range(5, 40))
+    assert result["only_in_prod2"] == [] and result["different"] == []
@@ -0,0 +1,229 @@
+# Pruebas de CircuitBreaker y fan_out con _get_json simulado (sin upstreams reales)
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import app as ms4  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def fresh_breakers(monkeypatch):
+    breakers = {key: ms4.CircuitBreaker(failures=3, reset=0.2) for key in ms4.BREAKERS}
+    monkeypatch.setattr(ms4, "BREAKERS", breakers)
+    monkeypatch.setattr(ms4, "HEDGE_AFTER", 0)
+    return breakers
+
+
+def stub_upstream(monkeypatch, behaviour):
+    """behaviour(url, timeout) -> datos o excepción; devuelve la lista de URLs llamadas"""
+    calls = []
+    lock = threading.Lock()
+
+    def fake_get_json(url, timeout):
+        with lock:
+            calls.append(url)
+        return behaviour(url, timeout)
+
+    monkeypatch.setattr(ms4, "_get_json", fake_get_json)
+    return calls
+
+
+def wait_for(predicate, timeout=2.0):
+    end = time.monotonic() + timeout
+    while time.monotonic() < end:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+# ---------- CircuitBreaker ----------
+def test_breaker_opens_after_consecutive_failures():
+    br = ms4.CircuitBreaker(failures=3, reset=10)
+    for _ in range(2):
+        br.failure()
+    assert br.allow()
+    br.failure()
+    assert br.state == "open"
+    assert not br.allow()
+
+
+def test_breaker_half_open_allows_single_probe_and_closes_on_success():
+    br = ms4.CircuitBreaker(failures=1, reset=0.05)
+    br.failure()
+    time.sleep(0.06)
+    assert br.allow()
+    assert br.state == "half_open"
+    assert not br.allow()
+    br.success()
+    assert br.snapshot() == {"state": "closed", "failures": 0}
+
+
+def test_breaker_half_open_failure_reopens():
+    br = ms4.CircuitBreaker(failures=3, reset=0.05)
+    for _ in range(3):
+        br.failure()
+    time.sleep(0.06)
+    assert br.allow()
+    br.failure()
+    assert br.state == "open"
+
+
+# ---------- fan_out ----------
+CALLS = {
+    "users": ("prod1", "MS1", "/users"),
+    "patients": ("prod1", "MS2", "/patients"),
+}
+
+
+def test_partial_results_with_per_source_status(monkeypatch):
+    def behaviour(url, timeout):
+        if "/patients" in url:
+            raise ValueError("boom")
+        return [1, 2]
+
+    stub_upstream(monkeypatch, behaviour)
+    results, sources = ms4.fan_out(CALLS, deadline=1)
+    assert results["users"] == [1, 2]
+    assert results["patients"] is None
+    assert sources["users"]["status"] == "ok"
+    assert sources["patients"]["status"] == "error"
+
+
+def test_open_breaker_skips_upstream(monkeypatch, fresh_breakers):
+    calls = stub_upstream(monkeypatch, lambda url, timeout: [])
+    for _ in range(3):
+        fresh_breakers[("prod1", "MS2")].failure()
+    _, sources = ms4.fan_out(CALLS, deadline=1)
+    assert sources["patients"] == {"status": "circuit_open"}
+    assert not any("/patients" in url for url in calls)
+
+
+def test_caller_deadline_does_not_open_breaker(monkeypatch, fresh_breakers):
+    def slow_but_healthy(url, timeout):
+        time.sleep(0.05)
+        return []
+
+    stub_upstream(monkeypatch, slow_but_healthy)
+    for _ in range(5):
+        _, sources = ms4.fan_out(CALLS, deadline=0.001)
+        assert sources["users"]["status"] == "timeout"
+    assert wait_for(lambda: all(b.state == "closed" and b.failures == 0 for b in fresh_breakers.values()))
+    _, sources = ms4.fan_out(CALLS, deadline=1)
+    assert sources["users"]["status"] == "ok"
+
+
+def test_upstream_timeout_counts_once_per_call(monkeypatch, fresh_breakers):
+    def timeout_error(url, timeout):
+        raise TimeoutError("read timed out")
+
+    stub_upstream(monkeypatch, timeout_error)
+    ms4.fan_out({"users": CALLS["users"]}, deadline=1)
+    assert fresh_breakers[("prod1", "MS1")].failures == 1
+
+
+def test_hedge_sends_at_most_one_extra_attempt(monkeypatch, fresh_breakers):
+    monkeypatch.setattr(ms4, "HEDGE_AFTER", 0.02)
+
+    def slow_failure(url, timeout):
+        time.sleep(0.05)
+        raise ValueError("upstream 500")
+
+    calls = stub_upstream(monkeypatch, slow_failure)
+    _, sources = ms4.fan_out({"users": CALLS["users"]}, deadline=1)
+    assert len(calls) == 2
+    assert sources["users"]["status"] == "error"
+    assert fresh_breakers[("prod1", "MS1")].failures == 1
+
+
+def test_hedge_wins_against_slow_first_attempt(monkeypatch):
+    monkeypatch.setattr(ms4, "HEDGE_AFTER", 0.02)
+    attempts = []
+
+    def first_slow(url, timeout):
+        attempts.append(url)
+        if len(attempts) == 1:
+            time.sleep(0.5)
+        return ["fast"]
+
+    stub_upstream(monkeypatch, first_slow)
+    t0 = time.monotonic()
+    results, sources = ms4.fan_out({"users": CALLS["users"]}, deadline=1)
+    assert results["users"] == ["fast"]
+    assert sources["users"]["status"] == "ok"
+    assert time.monotonic() - t0 < 0.4
+
+
+def test_no_hedge_while_half_open(monkeypatch, fresh_breakers):
+    monkeypatch.setattr(ms4, "HEDGE_AFTER", 0.01)
+    br = fresh_breakers[("prod1", "MS1")]
+    for _ in range(3):
+        br.failure()
+    time.sleep(0.25)
+
+    def slow(url, timeout):
+        time.sleep(0.1)
+        return []
+
+    calls = stub_upstream(monkeypatch, slow)
+    _, sources = ms4.fan_out({"users": CALLS["users"]}, deadline=1)
+    assert len(calls) == 1
+    assert sources["users"]["status"] == "ok"
+    assert br.state == "closed"
+
+
+def test_half_open_probe_stuck_in_pool_is_released(monkeypatch, fresh_breakers):
+    br = fresh_breakers[("prod1", "MS1")]
+    for _ in range(3):
+        br.failure()
+    time.sleep(0.25)
+    stub_upstream(monkeypatch, lambda url, timeout: [])
+    pool = ms4.ThreadPoolExecutor(max_workers=1)
+    busy = threading.Event()
+    pool.submit(busy.wait, 1)     # pool saturado: la prueba no llega a arrancar
+    _, sources = ms4.fan_out({"users": CALLS["users"]}, deadline=0.05, executor=pool)
+    assert sources["users"]["status"] == "timeout"
+    busy.set()
+    assert wait_for(lambda: br.state == "open")
+    time.sleep(0.25)
+    assert br.allow()
+    assert br.state == "half_open"
+    pool.shutdown()
+
+
+def test_aggregate_rejects_non_positive_deadline():
+    client = ms4.app.test_client()
+    assert client.get("/aggregate?deadline=0").status_code == 400
+    assert client.get("/aggregate?deadline=-1").status_code == 400
+
+
+# ---------- reconcile ----------
+def test_reconcile_checksums_are_batched_and_skip_breakers(monkeypatch, fresh_breakers):
+    monkeypatch.setattr(ms4, "RECONCILE_PARTS", 4)
+    in_flight, peak = [0], [0]
+    lock = threading.Lock()
+
+    def failing(url, timeout):
+        with lock:
+            in_flight[0] += 1
+            peak[0] = max(peak[0], in_flight[0])
+        time.sleep(0.02)
+        with lock:
+            in_flight[0] -= 1
+        if "from=8&" in url:
+            raise ValueError("upstream 500")
+        return {"count": 0, "hash": "0"}
+
+    calls = stub_upstream(monkeypatch, failing)
+    stats = {"requests": 0, "bytes": 0}
+    ranges = [(i, i + 1) for i in range(12)]
+    with pytest.raises(ms4.ReconcileError):
+        ms4._checksums(("prod1", "prod2"), "MS1", "users", ranges, stats)
+    assert peak[0] <= 4 * 2
+    assert len(calls) == 3 * 4 * 2     # se detiene en el lote que falla
+    assert stats["requests"] == 2 * 4 * 2
+    assert all(b.state == "closed" and b.failures == 0 for b in fresh_breakers.values())
@@ -1,4 +1,5 @@
 from flask import Flask, jsonify
+import os
 app = Flask(__name__)
 @app.route('/analytics/exams_by_specialty')
 def exams_by_specialty():
@@ -11,4 +12,4 @@ def viewsample():
     return jsonify({"view":"sample","rows":10})
 
 if __name__=='__main__':
-    app.run(host='0.0.0.0', port=5005)
+    app.run(host='0.0.0.0', port=int(os.getenv('PORT', '5005')))
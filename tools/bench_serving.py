@@ -0,0 +1,66 @@
+# bench_serving.py - compara throughput/latencia entre el servidor de desarrollo y gunicorn/uvicorn
+# Uso:
+#   python tools/bench_serving.py http://localhost:5005/analytics/viewsample              # un solo destino
+#   python tools/bench_serving.py dev=http://localhost:6005/... prod=http://localhost:5005/...
+# Variables: CONCURRENCY (default 32), REQUESTS (default 2000)
+# Solo usa la librería estándar.
+import os, sys, time, threading, http.client
+from urllib.parse import urlsplit
+
+CONCURRENCY = int(os.getenv("CONCURRENCY", "32"))
+REQUESTS = int(os.getenv("REQUESTS", "2000"))
+
+
+def worker(url, count, latencies, errors):
+    u = urlsplit(url)
+    path = u.path + ("?" + u.query if u.query else "")
+    conn = None
+    for _ in range(count):
+        t0 = time.perf_counter()
+        try:
+            if conn is None:
+                conn = http.client.HTTPConnection(u.hostname, u.port or 80, timeout=10)
+            conn.request("GET", path)
+            r = conn.getresponse()
+            r.read()
+            if r.status >= 500:
+                errors.append(r.status)
+            if r.getheader("Connection", "").lower() == "close":
+                conn.close(); conn = None
+        except Exception as e:
+            errors.append(str(e))
+            if conn is not None:
+                conn.close()
+            conn = None
+            continue
+        latencies.append(time.perf_counter() - t0)
+    if conn is not None:
+        conn.close()
+
+
+def run(url):
+    latencies, errors = [], []
+    per = [REQUESTS // CONCURRENCY + (1 if i < REQUESTS % CONCURRENCY else 0) for i in range(CONCURRENCY)]
+    threads = [threading.Thread(target=worker, args=(url, n, latencies, errors)) for n in per]
+    t0 = time.perf_counter()
+    for t in threads: t.start()
+    for t in threads: t.join()
+    elapsed = time.perf_counter() - t0
+    latencies.sort()
+    pct = lambda p: latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000 if latencies else 0
+    return {
+        "rps": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(pct(0.50), 1),
+        "p95_ms": round(pct(0.95), 1),
+        "p99_ms": round(pct(0.99), 1),
+        "errors": len(errors),
+    }
+
+
+if __name__ == "__main__":
+    targets = sys.argv[1:] or ["http://localhost:5005/analytics/viewsample"]
+    print(f"concurrency={CONCURRENCY} requests={REQUESTS}")
+    for t in targets:
+        name, url = t.split("=", 1) if "://" not in t.split("=", 1)[0] else ("", t)
+        res = run(url)
+        print(f"{name or url:<10} " + "  ".join(f"{k}={v}" for k, v in res.items()))